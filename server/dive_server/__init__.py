@@ -11,10 +11,27 @@ from girder.utility.model_importer import ModelImporter
 from dive_utils.constants import SETTINGS_CONST_JOBS_CONFIGS, UserPrivateQueueEnabledMarker
 
 from .client_webroot import ClientWebroot
-from .event import process_fs_import, process_s3_import, send_new_user_email
+from .event import (
+    image_file_changed,
+    image_leaving_manifest,
+    image_saved_to_manifest,
+    process_fs_import,
+    process_s3_import,
+    remove_dataset_stats,
+    remove_image_manifest,
+    send_new_user_email,
+)
+from .utils import DatasetStats, ImageManifest, ImageManifestItem, TracksSavedEvent
 from .viame import Viame
 from .viame_detection import ViameDetection
-from .viame_summary import SummaryItem, ViameSummary
+from .viame_summary import (
+    SummaryContribution,
+    SummaryItem,
+    ViameSummary,
+    update_summary_on_folder_remove,
+    update_summary_on_folder_save,
+    update_summary_on_tracks_saved,
+)
 
 
 @setting_utilities.validator({SETTINGS_CONST_JOBS_CONFIGS})
@@ -33,6 +50,12 @@ def validateSettings(doc):
 class GirderPlugin(plugin.GirderPlugin):
     def load(self, info):
         ModelImporter.registerModel('summaryItem', SummaryItem, plugin='dive_server')
+        ModelImporter.registerModel('imageManifestItem', ImageManifestItem, plugin='dive_server')
+        ModelImporter.registerModel('imageManifest', ImageManifest, plugin='dive_server')
+        ModelImporter.registerModel(
+            'summaryContribution', SummaryContribution, plugin='dive_server'
+        )
+        ModelImporter.registerModel('datasetStats', DatasetStats, plugin='dive_server')
         User().exposeFields(AccessType.READ, UserPrivateQueueEnabledMarker)
 
         info["apiRoot"].viame = Viame()
@@ -59,6 +82,20 @@ class GirderPlugin(plugin.GirderPlugin):
             "process_s3_import",
             process_s3_import,
         )
+        # Item saves cover creation, renames and moves. Girder has no event after an item
+        # is deleted, so images leaving a folder are marked before the change instead.
+        events.bind('model.item.save', 'image_manifests', image_leaving_manifest)
+        events.bind('model.item.remove', 'image_manifests', image_leaving_manifest)
+        events.bind('model.item.save.after', 'image_manifests', image_saved_to_manifest)
+        # File uploads and removals do not save the item they belong to
+        events.bind('model.file.save.after', 'image_manifests', image_file_changed)
+        events.bind('model.file.remove', 'image_manifests', image_file_changed)
+        events.bind('model.folder.remove', 'image_manifests', remove_image_manifest)
+        # Keep the published data summary current
+        events.bind(TracksSavedEvent, 'update_summary', update_summary_on_tracks_saved)
+        events.bind('model.folder.save', 'update_summary', update_summary_on_folder_save)
+        events.bind('model.folder.remove', 'update_summary', update_summary_on_folder_remove)
+        events.bind('model.folder.remove', 'remove_dataset_stats', remove_dataset_stats)
         events.bind(
             'model.user.save.created',
             'send_new_user_email',
@@ -23,9 +23,12 @@ from dive_utils.constants import (
     VideoType,
     csvRegex,
     imageRegex,
+    safeImageRegex,
     videoRegex,
 )
 
+from .utils import DatasetStats, ImageManifest, ImageManifestItem, touch_image_manifest
+
 
 def send_new_user_email(event):
     try:
@@ -106,3 +109,52 @@ def process_fs_import(event):
 
 def process_s3_import(event):
     return process_assetstore_import(event, {AssetstoreSourceMarker: 's3'})
+
+
+def _is_manifest_image(item: dict) -> bool:
+    return bool(item.get('folderId')) and bool(safeImageRegex.search(item.get('name', '')))
+
+
+def image_leaving_manifest(event):
+    """
+    Before an item is removed, or saved out of a folder's web-safe images by a move
+    or rename, mark it as leaving so that manifests built meanwhile are not kept
+    """
+    item = event.info
+    if '_id' not in item:
+        return
+    previous = Item().findOne({'_id': item['_id']}, fields=['name', 'folderId'])
+    if previous is None or not _is_manifest_image(previous):
+        return
+    removed = event.name.startswith('model.item.remove')
+    if removed or previous['folderId'] != item.get('folderId') or not _is_manifest_image(item):
+        touch_image_manifest(previous['folderId'], leavingItemId=item['_id'])
+
+
+def image_saved_to_manifest(event):
+    """After a web-safe image is created, renamed or moved in, its folder's manifest is stale"""
+    if _is_manifest_image(event.info):
+        touch_image_manifest(event.info['folderId'])
+
+
+def image_file_changed(event):
+    """
+    Uploads and file removals change an image's size and checksum
+    without saving its item, so they make its folder's manifest stale too
+    """
+    itemId = event.info.get('itemId')
+    if not itemId:
+        return
+    item = Item().findOne({'_id': itemId}, fields=['name', 'folderId'])
+    if item is not None and _is_manifest_image(item):
+        touch_image_manifest(item['folderId'])
+
+
+def remove_image_manifest(event):
+    folderId = str(event.info['_id'])
+    ImageManifest().collection.delete_one({'folderId': folderId})
+    ImageManifestItem().collection.delete_many({'folderId': folderId})
+
+
+def remove_dataset_stats(event):
+    DatasetStats().collection.delete_one({'folderId': str(event.info['_id'])})
@@ -0,0 +1,84 @@
+from typing import List
+
+from girder.models.folder import Folder
+from girder.models.token import Token
+from girder.models.user import User
+from girder_jobs.models.job import Job
+
+from dive_server.utils import getCloneRoot, verify_dataset
+from dive_tasks.tasks import export_dataset
+from dive_utils.constants import (
+    JOBCONST_PRIVATE_QUEUE,
+    JOBCONST_RESULTS_FOLDER_ID,
+    UserPrivateQueueEnabledMarker,
+    ViameDataFolderName,
+)
+from dive_utils.types import ExportJob, GirderModel
+
+ExportOutputFolderName = "VIAME Exports"
+
+
+def export_output_folder(user: User):
+    """Ensure that the user has an export archives folder."""
+    viameFolder = Folder().createFolder(
+        user,
+        ViameDataFolderName,
+        description="VIAME data storage.",
+        parentType="user",
+        public=False,
+        creator=user,
+        reuseExisting=True,
+    )
+
+    return Folder().createFolder(
+        viameFolder,
+        ExportOutputFolderName,
+        description="Dataset export archives are placed here.",
+        public=False,
+        creator=user,
+        reuseExisting=True,
+    )
+
+
+def run_export(
+    user: GirderModel,
+    folder: GirderModel,
+    includeMedia: bool,
+    includeDetections: bool,
+    excludeBelowThreshold: bool,
+    typeFilter: List[str],
+    queue: str,
+) -> GirderModel:
+    """
+    Assemble the same archive as export_all on a worker and upload it to the
+    user's export folder, where it can be downloaded with HTTP Range support.
+    """
+    verify_dataset(folder)
+    mediaFolder = getCloneRoot(user, folder)
+
+    token = Token().createToken(user=user, days=2)
+    output_folder = export_output_folder(user)
+    job_is_private = user.get(UserPrivateQueueEnabledMarker, False)
+
+    params: ExportJob = {
+        "input_folder": str(folder["_id"]),
+        "media_folder": str(mediaFolder["_id"]),
+        "output_folder": str(output_folder["_id"]),
+        "include_media": includeMedia,
+        "include_detections": includeDetections,
+        "exclude_below_threshold": excludeBelowThreshold,
+        "type_filter": typeFilter,
+    }
+    newjob = export_dataset.apply_async(
+        queue=queue,
+        kwargs=dict(
+            params=params,
+            girder_job_title=f"Exporting {str(folder['name'])}",
+            girder_client_token=str(token["_id"]),
+            girder_job_type="private" if job_is_private else "export",
+        ),
+    )
+    newjob.job[JOBCONST_PRIVATE_QUEUE] = job_is_private
+    newjob.job[JOBCONST_RESULTS_FOLDER_ID] = str(output_folder["_id"])
+    Job().save(newjob.job)
+    return newjob.job
@@ -1,11 +1,30 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import functools
+import hashlib
 import io
 import json
 import os
 from pathlib import Path
-from typing import Callable, Dict, Generator, List, Optional, Tuple, Type
+import tempfile
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
 
+from bson.objectid import ObjectId
+import cherrypy
+from girder import events
+from girder.api.rest import setContentDisposition, setResponseHeader
 from girder.constants import AccessType
 from girder.exceptions import RestException
 from girder.models.file import File
@@ -13,11 +32,13 @@ from girder.models.folder import Folder
 from girder.models.item import Item
 from girder.models.model_base import AccessControlledModel
 from girder.models.upload import Upload
+from girder.utility import ziputil
+from girder.utility.filesystem_assetstore_adapter import FilesystemAssetstoreAdapter
 from pydantic.main import BaseModel
 import pymongo
 from pymongo.cursor import Cursor
 
-from dive_utils import asbool, fromMeta, models, strNumericCompare
+from dive_utils import asbool, fromMeta, models, ordered_prefetch, strNumericCompare, tarstream
 from dive_utils.constants import (
     ConfidenceFiltersMarker,
     DatasetMarker,
@@ -27,14 +48,46 @@ from dive_utils.constants import (
     ImageSequenceType,
     PublishedMarker,
     TypeMarker,
+    ValidatedMarker,
     VideoType,
     csvRegex,
+    imageRegex,
     jsonRegex,
     safeImageRegex,
+    videoRegex,
 )
-from dive_utils.serializers import kwcoco, viame
+from dive_utils.export_cache import ExportCache, read_range, resolve_range
+from dive_utils.serializers import kwcoco, meva, viame
+from dive_utils.stats import compute_dataset_stats, occupancy_timeline
 from dive_utils.types import GirderModel
 
+# Number of media files fetched ahead of the export zip stream
+ExportPrefetchConcurrency = 8
+# Media files larger than this are streamed from the assetstore instead of buffered
+ExportPrefetchMaxSize = 32 * 1024 * 1024
+
+# Triggered after saveTracks stores a new revision, with info {'folder', 'tracks', 'stats'}
+TracksSavedEvent = 'dive_server.tracks_saved'
+
+# Number of datasets whose CSV is rendered ahead of a bulk export zip stream
+BulkExportCsvConcurrency = 4
+
+# Number of datasets whose stats are loaded or computed ahead of a MaxN report stream
+MaxNConcurrency = 8
+
+# Occupancy timelines are coarsened to at most this many buckets per type
+TimelineMaxBuckets = 100000
+# Largest bucketSize the timeline endpoint accepts, which is more than any dataset's length
+TimelineMaxBucketSize = 10 ** 7
+
+# Generated exports are kept on local disk and evicted least recently used first
+export_cache = ExportCache(
+    os.environ.get(
+        'DIVE_EXPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'dive_export_cache')
+    ),
+    int(os.environ.get('DIVE_EXPORT_CACHE_SIZE', 2 * 1024 * 1024 * 1024)),
+)
+
 
 class PydanticModel(AccessControlledModel):
     schema: Type[BaseModel]
@@ -65,6 +118,11 @@ def detections_item(folder: Folder, strict=False) -> Optional[GirderModel]:
     return first_item
 
 
+def detections_trusted(item: Optional[GirderModel]) -> bool:
+    """Whether a detection item's tracks were validated when it was saved"""
+    return item is not None and asbool(fromMeta(item, ValidatedMarker, False))
+
+
 def detections_file(folder: Folder, strict=False) -> Optional[GirderModel]:
     item = detections_item(folder, strict)
     if item is None and not strict:
@@ -138,13 +196,30 @@ def get_track_and_attributes_from_coco(file: GirderModel) -> Tuple[dict, dict, b
     return {}, {}, False
 
 
-def saveTracks(folder, tracks, user):
+def saveTracks(folder, tracks, user, validated=False):
+    """
+    Save a new revision of track json for a folder.
+    Tracks are validated here unless the caller has already validated every one,
+    so that readers can trust any revision carrying the ValidatedMarker.
+    Stats of the revision are computed and stored alongside it,
+    then TracksSavedEvent is triggered.
+    """
+    if not validated:
+        tracks = {
+            trackId: models.Track(**track).dict(exclude_none=True)
+            for trackId, track in tracks.items()
+        }
+
     timestamp = datetime.now().strftime("%m-%d-%Y_%H:%M:%S")
     item_name = f"result_{timestamp}.json"
 
     move_existing_result_to_auxiliary_folder(folder, user)
     newResultItem = Item().createItem(item_name, user, folder)
-    Item().setMetadata(newResultItem, {DetectionMarker: str(folder["_id"])}, allowNull=True)
+    Item().setMetadata(
+        newResultItem,
+        {DetectionMarker: str(folder["_id"]), ValidatedMarker: True},
+        allowNull=True,
+    )
 
     json_bytes = json.dumps(tracks).encode()
     byteIO = io.BytesIO(json_bytes)
@@ -157,6 +232,42 @@ def saveTracks(folder, tracks, user):
         user=user,
         mimeType="application/json",
     )
+    stats = compute_dataset_stats(
+        str(folder['_id']), str(newResultItem['_id']), tracks, trusted=True
+    )
+    save_dataset_stats(stats)
+    events.trigger(TracksSavedEvent, info={'folder': folder, 'tracks': tracks, 'stats': stats})
+
+
+class DatasetStats(PydanticModel):
+    def initialize(self):
+        super().initialize("datasetStats", models.DatasetStatsSchema)
+        self.ensureIndices([('folderId', {'unique': True})])
+
+
+def save_dataset_stats(stats: models.DatasetStatsSchema):
+    """Replace the stored stats of a dataset; only the latest revision is kept"""
+    DatasetStats().collection.replace_one({'folderId': stats.folderId}, stats.dict(), upsert=True)
+
+
+def dataset_stats(folder: GirderModel) -> models.DatasetStatsSchema:
+    """
+    Stats of the current revision of a dataset.
+    Revisions saved before stats existed, or created by imports and pipelines,
+    are computed on first read.
+    """
+    folderId = str(folder['_id'])
+    item = detections_item(folder)
+    revision = str(item['_id']) if item else None
+    doc = DatasetStats().findOne(
+        {'folderId': folderId, 'revision': revision, 'max_n': {'$ne': None}}
+    )
+    if doc is not None:
+        return models.DatasetStatsSchema(**doc)
+    trackData = getTrackData(detections_file(folder))
+    stats = compute_dataset_stats(folderId, revision, trackData, trusted=detections_trusted(item))
+    save_dataset_stats(stats)
+    return stats
 
 
 def saveImportAttributes(folder, attributes, user):
@@ -280,25 +391,211 @@ def createSoftClone(
     return cloned_folder
 
 
-def valid_images(
+class ImageManifestItem(PydanticModel):
+    def initialize(self):
+        super().initialize("imageManifestItem", models.ImageManifestItemSchema)
+        self.ensureIndices(
+            [
+                ([('build', 1), ('frame', 1)], {'unique': True}),
+                'folderId',
+            ]
+        )
+
+
+class ImageManifest(PydanticModel):
+    def initialize(self):
+        super().initialize("imageManifest", models.ImageManifestSchema)
+        self.ensureIndices([([('folderId', 1)], {'unique': True})])
+
+
+# Item lookups per query when resolving the files of a manifest
+ImageManifestChecksumBatchSize = 5000
+# How long an image may be marked as leaving before its removal is assumed to have been abandoned
+ImageManifestLeavingTimeout = timedelta(minutes=1)
+
+
+def touch_image_manifest(folderId: str, leavingItemId: Optional[str] = None):
+    """
+    Mark a media folder's manifest out of date, after one of its images has changed,
+    or before an image is removed from it
+    """
+    update: Dict[str, Any] = {'$inc': {'version': 1}}
+    if leavingItemId is not None:
+        update['$push'] = {'leaving': {'itemId': str(leavingItemId), 'at': datetime.utcnow()}}
+    # Upsert, so that a build which has only just started still sees the change
+    ImageManifest().collection.update_one({'folderId': str(folderId)}, update, upsert=True)
+
+
+def _settle_leaving_items(folderId: str, leaving: List[dict]) -> Set[str]:
+    """
+    Forget leaving images that are gone, or whose removal was abandoned,
+    and return the ids of those that are still on their way out
+    """
+    ids = [ObjectId(entry['itemId']) for entry in leaving]
+    present = {
+        str(item['_id'])
+        for item in Item().find(
+            {'_id': {'$in': ids}, 'folderId': ObjectId(folderId)}, fields=['name']
+        )
+        if safeImageRegex.search(item['name'])
+    }
+    cutoff = datetime.utcnow() - ImageManifestLeavingTimeout
+    pending = {
+        entry['itemId'] for entry in leaving if entry['itemId'] in present and entry['at'] > cutoff
+    }
+    settled = [entry['itemId'] for entry in leaving if entry['itemId'] not in pending]
+    if settled:
+        ImageManifest().collection.update_one(
+            {'folderId': folderId}, {'$pull': {'leaving': {'itemId': {'$in': settled}}}}
+        )
+    return pending
+
+
+def build_image_manifest(mediaFolder: GirderModel) -> Tuple[Optional[str], List[dict]]:
+    """
+    Build the frame-ordered manifest of a media folder's web-safe images.
+
+    The new build becomes current in one conditional update, and only if no image in
+    the folder changed while it was read. Otherwise it is discarded and None is returned
+    as its build, and callers should use the returned entries as a one-off snapshot.
+    """
+    folderId = str(mediaFolder['_id'])
+    state = ImageManifest().collection.find_one_and_update(
+        {'folderId': folderId},
+        {'$setOnInsert': {'version': 0, 'leaving': []}},
+        upsert=True,
+        return_document=pymongo.ReturnDocument.AFTER,
+    )
+    version = state['version']
+    pending = _settle_leaving_items(folderId, state.get('leaving', []))
+    images = sorted(
+        (
+            image
+            for image in Folder().childItems(
+                mediaFolder,
+                filters={"lowerName": {"$regex": safeImageRegex}},
+                fields=['name'],
+            )
+            if str(image['_id']) not in pending
+        ),
+        key=functools.cmp_to_key(lambda a, b: strNumericCompare(a['name'], b['name'])),
+    )
+    files: Dict[str, dict] = {}
+    for start in range(0, len(images), ImageManifestChecksumBatchSize):
+        batch = [image['_id'] for image in images[start : start + ImageManifestChecksumBatchSize]]
+        for file in File().find({'itemId': {'$in': batch}}, fields=['itemId', 'size', 'sha512']):
+            files[str(file['itemId'])] = file
+
+    build = str(ObjectId())
+    entries = []
+    for frame, image in enumerate(images):
+        file = files.get(str(image['_id']), {})
+        entries.append(
+            {
+                'folderId': folderId,
+                'build': build,
+                'frame': frame,
+                'itemId': str(image['_id']),
+                'name': image['name'],
+                'size': file.get('size', 0),
+                'fileId': str(file['_id']) if file else None,
+                'sha512': file.get('sha512'),
+            }
+        )
+    if pending:
+        # The listing may still contain images that are about to be removed
+        return None, entries
+
+    if entries:
+        # insert_many adds _id to each entry, so insert copies
+        ImageManifestItem().collection.insert_many([dict(entry) for entry in entries])
+    previous = ImageManifest().collection.find_one_and_update(
+        {'folderId': folderId, 'version': version, 'builtVersion': {'$ne': version}},
+        {'$set': {'build': build, 'builtVersion': version}},
+    )
+    if previous is None:
+        # The folder changed, or a concurrent build of this version finished first
+        ImageManifestItem().collection.delete_many({'build': build})
+        return None, entries
+    if previous.get('build'):
+        ImageManifestItem().collection.delete_many({'build': previous['build']})
+    return build, entries
+
+
+def current_image_manifest(mediaFolder: GirderModel) -> Tuple[Optional[str], List[dict]]:
+    """
+    The current build of a media folder's manifest, building it if it is missing or stale.
+    Entries are only returned when no build could be made current.
+    """
+    state = ImageManifest().collection.find_one({'folderId': str(mediaFolder['_id'])})
+    if state is not None and state.get('build') and state.get('builtVersion') == state['version']:
+        return state['build'], []
+    return build_image_manifest(mediaFolder)
+
+
+def image_manifest_entry_to_item(entry: dict) -> dict:
+    """The subset of item fields that image manifest consumers rely on"""
+    return {
+        '_id': entry['itemId'],
+        'name': entry['name'],
+        'size': entry['size'],
+        'frame': entry['frame'],
+        'fileId': entry.get('fileId'),
+        'sha512': entry.get('sha512'),
+    }
+
+
+def image_manifest_page(
     folder: GirderModel,
     user: GirderModel,
-) -> List[GirderModel]:
+    offset=0,
+    limit=0,
+    frameStart: Optional[int] = None,
+    frameEnd: Optional[int] = None,
+) -> Tuple[int, List[dict]]:
     """
-    Any time images are used where frame alignment matters, this function must be used
+    The number of image manifest entries of a dataset within an inclusive frame range,
+    and a page of them as items
     """
-    images = Folder().childItems(
-        getCloneRoot(user, folder),
-        filters={"lowerName": {"$regex": safeImageRegex}},
+    build, entries = current_image_manifest(getCloneRoot(user, folder))
+    if build is None:
+        # The folder is changing, so serve the snapshot that was just read
+        selected = [
+            entry
+            for entry in entries
+            if (frameStart is None or entry['frame'] >= frameStart)
+            and (frameEnd is None or entry['frame'] <= frameEnd)
+        ]
+        page = selected[offset : offset + limit] if limit else selected[offset:]
+        return len(selected), [image_manifest_entry_to_item(entry) for entry in page]
+    query: Dict[str, Any] = {'build': build}
+    frames = {}
+    if frameStart is not None:
+        frames['$gte'] = frameStart
+    if frameEnd is not None:
+        frames['$lte'] = frameEnd
+    if frames:
+        query['frame'] = frames
+    cursor = ImageManifestItem().find(query, offset=offset, limit=limit, sort=[('frame', 1)])
+    return (
+        ImageManifestItem().collection.count_documents(query),
+        [image_manifest_entry_to_item(entry) for entry in cursor],
     )
 
-    def unwrapItem(item1, item2):
-        return strNumericCompare(item1['name'], item2['name'])
 
-    return sorted(
-        images,
-        key=functools.cmp_to_key(unwrapItem),
-    )
+def valid_images(
+    folder: GirderModel,
+    user: GirderModel,
+    offset=0,
+    limit=0,
+    frameStart: Optional[int] = None,
+    frameEnd: Optional[int] = None,
+) -> List[dict]:
+    """
+    Any time images are used where frame alignment matters, this function must be used.
+    Reads the persisted image manifest, building it on first use.
+    """
+    return image_manifest_page(folder, user, offset, limit, frameStart, frameEnd)[1]
 
 
 def get_annotation_csv_generator(
@@ -317,6 +614,7 @@ def get_annotation_csv_generator(
         imageFiles = [img['name'] for img in valid_images(folder, user)]
 
     thresholds = fromMeta(folder, "confidenceFilters", {})
+    trusted = detections_trusted(detections_item(folder, strict=True))
     annotation_file = detections_file(folder, strict=True)
     track_dict = getTrackData(annotation_file)
 
@@ -328,8 +626,278 @@ def get_annotation_csv_generator(
             filenames=imageFiles,
             fps=fps,
             typeFilter=typeFilter,
+            trusted=trusted,
         ):
             yield data
 
     filename = folder["name"] + ".csv"
     return filename, downloadGenerator
+
+
+def get_annotation_kpf_generators(
+    folder: GirderModel,
+) -> Dict[str, Callable[[], Generator[str, None, None]]]:
+    """
+    Get a generator function for each MEVA KPF yaml document of a folder,
+    keyed by the file name it should be written to
+    """
+    fps = None
+    if fromMeta(folder, TypeMarker) == VideoType:
+        fps = fromMeta(folder, FPSMarker)
+
+    trusted = detections_trusted(detections_item(folder, strict=True))
+    track_dict = getTrackData(detections_file(folder, strict=True))
+
+    def makeGenerator(suffix: str) -> Callable[[], Generator[str, None, None]]:
+        def downloadGenerator():
+            yield from meva.export_tracks_as_kpf(track_dict, fps=fps, trusted=trusted)[suffix]
+
+        return downloadGenerator
+
+    return {f'{folder["name"]}.{suffix}.yml': makeGenerator(suffix) for suffix in meva.KPF_SUFFIXES}
+
+
+def local_file_path(file: GirderModel) -> Optional[str]:
+    """
+    The path of a file stored in or imported into a filesystem assetstore,
+    or None if it can only be read through its assetstore adapter
+    """
+    if not file.get('assetstoreId'):
+        return None
+    adapter = File().getAssetstoreAdapter(file)
+    if not isinstance(adapter, FilesystemAssetstoreAdapter):
+        return None
+    path = adapter.fullPath(file)
+    return path if os.path.isfile(path) else None
+
+
+def _prefetch_media_file(item: GirderModel) -> Optional[Tuple[str, int, Callable]]:
+    # Media items should only have 1 valid file
+    first = next(Item().fileList(item, data=False), None)
+    if first is None:
+        return None
+    path, file = first
+    size = file.get('size', 0)
+    localPath = local_file_path(file)
+    if localPath is not None:
+        # Local disk needs no read-ahead; bypass the adapter's small chunk loop
+        return path, size, lambda: read_range(open(localPath, 'rb'), 0, size)
+    stream = File().download(file, headers=False)
+    if size > ExportPrefetchMaxSize:
+        return path, size, stream
+    body = b''.join(chunk.encode('utf8') if isinstance(chunk, str) else chunk for chunk in stream())
+    return path, size, lambda: iter([body])
+
+
+def prefetch_media_files(
+    items: Iterable[GirderModel], concurrency=ExportPrefetchConcurrency
+) -> Iterator[Tuple[str, int, Callable]]:
+    """
+    Yield (path, size, stream function) for the first file of each media item in order,
+    reading the next few files from the assetstore concurrently so that exports
+    are not bound by the per-file latency of remote assetstores
+    """
+    for result in ordered_prefetch(_prefetch_media_file, items, concurrency):
+        if result is not None:
+            yield result
+
+
+def stream_image_archive(
+    folder: GirderModel,
+    user: GirderModel,
+    frameStart: Optional[int] = None,
+    frameEnd: Optional[int] = None,
+) -> Callable[[], Iterator[bytes]]:
+    """
+    Stream a dataset's web-safe images as one uncompressed tar in frame order,
+    with members named as in valid_images
+    """
+    entries = valid_images(folder, user, frameStart=frameStart, frameEnd=frameEnd)
+    missing = [entry['name'] for entry in entries if not entry.get('fileId')]
+    if missing:
+        # Leaving frames out would misalign every later frame
+        raise RestException(f"Images have no file: {', '.join(missing[:10])}")
+    mtime = int(datetime.now().timestamp())
+
+    def stream():
+        items = ({'_id': ObjectId(entry['_id']), 'name': entry['name']} for entry in entries)
+        media = ordered_prefetch(_prefetch_media_file, items, ExportPrefetchConcurrency)
+        for entry, result in zip(entries, media):
+            if result is None:
+                # The file was removed after streaming began, so abort rather than skip it
+                raise RuntimeError(f"Image {entry['name']} has no file")
+            _, size, gen = result
+            yield from tarstream.tar_file(entry['name'], size, gen(), mtime)
+        yield tarstream.tar_footer()
+
+    return stream
+
+
+def zip_add_file(
+    z: ziputil.ZipGenerator, gen: Callable[[], Iterable], path: str, compression=ziputil.STORE
+) -> Iterator[bytes]:
+    """
+    Add a file to a streaming zip with its own compression mode.
+    Media is already compressed, so only annotation text is worth deflating.
+    """
+    z.compression = compression
+    yield from z.addFile(gen, path)
+
+
+def zip_dataset(
+    z: ziputil.ZipGenerator,
+    folder: GirderModel,
+    user: GirderModel,
+    includeMedia: bool,
+    includeDetections: bool,
+    csvGen: Callable[[], Iterable],
+    path='',
+) -> Iterator[bytes]:
+    """Add a dataset's media, detection JSON and CSV to a streaming zip under path"""
+    if includeMedia:
+        mediaFolder = getCloneRoot(user, folder)
+        source_type = fromMeta(mediaFolder, TypeMarker)
+        mediaRegex = None
+        if source_type == ImageSequenceType:
+            mediaRegex = imageRegex
+        elif source_type == VideoType:
+            mediaRegex = videoRegex
+        for (mediaPath, _, file) in prefetch_media_files(
+            Folder().childItems(
+                mediaFolder,
+                filters={"lowerName": {"$regex": mediaRegex}},
+            )
+        ):
+            yield from zip_add_file(z, file, os.path.join(path, mediaPath), ziputil.STORE)
+
+    if includeDetections:
+        # add JSON detections
+        for (jsonPath, file) in Folder().fileList(
+            folder,
+            user=user,
+            subpath=False,
+            mimeFilter={'application/json'},
+        ):
+            yield from zip_add_file(z, file, os.path.join(path, jsonPath), ziputil.DEFLATE)
+        # add CSV detections
+        yield from zip_add_file(z, csvGen, os.path.join(path, "output_tracks.csv"), ziputil.DEFLATE)
+
+
+def render_annotation_csv(
+    folder: GirderModel, user: GirderModel, excludeBelowThreshold=False, typeFilter=None
+) -> bytes:
+    """
+    Get the complete annotation CSV for a folder, from the export cache when
+    export_detections has already rendered it with the same filters
+    """
+    key = export_cache_key(folder, user, 'csv', excludeBelowThreshold, typeFilter)
+    fp = export_cache.open(key)
+    if fp is not None:
+        with fp:
+            return fp.read()
+    _, gen = get_annotation_csv_generator(folder, user, excludeBelowThreshold, typeFilter)
+    return b''.join(export_cache.write_through(key, gen()))
+
+
+def export_cache_key(folder: GirderModel, user: GirderModel, *params) -> str:
+    """
+    Identify an export by the folder's detection revision, a hash of its media manifest,
+    the folder metadata the serializers read, and any request parameters
+    """
+    manifest = hashlib.sha256()
+    for item in Folder().childItems(getCloneRoot(user, folder), fields=['size', 'updated']):
+        manifest.update(f"{item['_id']}:{item.get('size')}:{item.get('updated')}\n".encode())
+    detections = detections_file(folder)
+    return ExportCache.make_key(
+        folder['name'],
+        detections['_id'] if detections else None,
+        manifest.hexdigest(),
+        fromMeta(folder, ConfidenceFiltersMarker, {}),
+        fromMeta(folder, FPSMarker),
+        *params,
+    )
+
+
+def _stream_file_range(
+    fp: BinaryIO, key: str, filename: str, mimeType: str
+) -> Callable[[], Iterator[bytes]]:
+    """
+    Serve an open file with a known length, honoring a single HTTP Range.
+    The export cache key is the ETag, so a resumed download only continues
+    through If-Range while it still refers to the same export.
+    """
+    size = os.fstat(fp.fileno()).st_size
+    etag = f'"{key}"'
+    status, offset, endByte = resolve_range(
+        size,
+        cherrypy.request.headers.get('Range'),
+        cherrypy.request.headers.get('If-Range'),
+        etag,
+    )
+    setResponseHeader('Accept-Ranges', 'bytes')
+    setResponseHeader('ETag', etag)
+    if status == 416:
+        fp.close()
+        setResponseHeader('Content-Range', f'bytes */{size}')
+        raise RestException('Requested range not satisfiable', code=416)
+    setResponseHeader('Content-Type', mimeType)
+    setContentDisposition(filename)
+    setResponseHeader('Content-Length', endByte - offset)
+    if status == 206:
+        setResponseHeader('Content-Range', f'bytes {offset}-{endByte - 1}/{size}')
+    cherrypy.response.status = status
+    return lambda: read_range(fp, offset, endByte)
+
+
+def occupancy_timeline_json(folder: GirderModel, bucketSize: int) -> bytes:
+    """
+    Serialized occupancy timeline of the current revision of a dataset,
+    kept in the export cache alongside other generated artifacts
+    """
+    item = detections_item(folder)
+    key = export_cache.make_key(
+        'timeline', str(folder['_id']), str(item['_id']) if item else None, bucketSize
+    )
+    fp = export_cache.open(key)
+    if fp is not None:
+        with fp:
+            return fp.read()
+    timeline = occupancy_timeline(
+        getTrackData(detections_file(folder)),
+        trusted=detections_trusted(item),
+        bucketSize=bucketSize,
+        maxBuckets=TimelineMaxBuckets,
+    )
+    return b''.join(export_cache.write_through(key, [timeline.json()]))
+
+
+def stream_cached_export(
+    key: str, filename: str, mimeType: str
+) -> Optional[Callable[[], Iterator[bytes]]]:
+    """Serve an export from the cache if present"""
+    fp = export_cache.open(key)
+    if fp is None:
+        return None
+    return _stream_file_range(fp, key, filename, mimeType)
+
+
+def stream_materialized_export(
+    key: str, filename: str, mimeType: str, gen: Callable[[], Iterable]
+) -> Callable[[], Iterator[bytes]]:
+    """
+    Generate an export completely before responding, so that even its first
+    download has a Content-Length and can be resumed with Range requests
+    """
+    cached = stream_cached_export(key, filename, mimeType)
+    if cached is not None:
+        return cached
+    # The cache may be disabled or the export too large for it, so keep a private copy
+    fp = tempfile.TemporaryFile()
+    for chunk in export_cache.write_through(key, gen()):
+        fp.write(chunk)
+    return _stream_file_range(fp, key, filename, mimeType)
+
+
+def write_through_export(key: str, gen: Callable[[], Iterable]) -> Callable[[], Iterator[bytes]]:
+    """Stream a generated export while storing it in the cache under key"""
+    return lambda: export_cache.write_through(key, gen())
@@ -2,7 +2,7 @@ from typing import List
 
 from girder.api import access
 from girder.api.describe import Description, autoDescribeRoute, describeRoute
-from girder.api.rest import Resource
+from girder.api.rest import Resource, setContentDisposition, setResponseHeader
 from girder.constants import AccessType
 from girder.exceptions import RestException
 from girder.models.file import File
@@ -31,7 +31,9 @@ from dive_utils.constants import (
     ConfidenceFiltersMarker,
     DatasetMarker,
     ForeignMediaIdMarker,
+    ImageSequenceType,
     PublishedMarker,
+    TypeMarker,
     UserPrivateQueueEnabledMarker,
     csvRegex,
     imageRegex,
@@ -43,19 +45,22 @@ from dive_utils.constants import (
 from dive_utils.serializers import meva
 from dive_utils.types import AvailableJobSchema, PipelineDescription
 
+from .exports import run_export
 from .pipelines import load_pipelines, run_pipeline
 from .training import ensure_csv_detections_file, training_output_folder
 from .transforms import GetPathFromItemId
 from .utils import (
+    build_image_manifest,
     createSoftClone,
     detections_file,
     detections_item,
     get_or_create_auxiliary_folder,
     getCloneRoot,
+    image_manifest_page,
     process_csv,
     process_json,
     saveTracks,
-    valid_images,
+    stream_image_archive,
     verify_dataset,
 )
 
@@ -67,6 +72,7 @@ class Viame(Resource):
 
         self.route("GET", ("datasets",), self.list_datasets)
         self.route("POST", ("dataset", ":id", "clone"), self.clone_dataset)
+        self.route("POST", ("dataset", ":id", "export"), self.run_export_task)
         self.route("GET", ("brand_data",), self.get_brand_data)
         self.route("GET", ("pipelines",), self.get_pipelines)
         self.route("GET", ("training_configs",), self.get_training_configs)
@@ -79,6 +85,7 @@ class Viame(Resource):
         self.route("PUT", ("attributes",), self.save_attributes)
         self.route("POST", ("validate_files",), self.validate_files)
         self.route("GET", ("valid_images",), self.get_valid_images)
+        self.route("GET", ("image_archive",), self.get_image_archive)
         self.route("PUT", ("user", ":id", "use_private_queue"), self.use_private_queue)
 
     def _get_queue_name(self, default="celery"):
@@ -204,6 +211,64 @@ class Viame(Resource):
         owner = self.getCurrentUser()
         return createSoftClone(owner, folder, parentFolder, name)
 
+    @access.user
+    @autoDescribeRoute(
+        Description("Export a dataset archive in a background job")
+        .modelParam(
+            "id",
+            description="folder id of a clip",
+            model=Folder,
+            required=True,
+            level=AccessType.READ,
+        )
+        .param(
+            "includeMedia",
+            "Include media content",
+            paramType="formData",
+            dataType="boolean",
+            default=True,
+        )
+        .param(
+            "includeDetections",
+            "Include detection content",
+            paramType="formData",
+            dataType="boolean",
+            default=True,
+        )
+        .param(
+            "excludeBelowThreshold",
+            "Exclude tracks with confidencePairs below set threshold",
+            paramType="formData",
+            dataType="boolean",
+            default=False,
+        )
+        .jsonParam(
+            "typeFilter",
+            "List of track types to filter by",
+            paramType="formData",
+            required=False,
+            default=[],
+            requireArray=True,
+        )
+    )
+    def run_export_task(
+        self,
+        folder,
+        includeMedia: bool,
+        includeDetections: bool,
+        excludeBelowThreshold: bool,
+        typeFilter: List[str],
+    ):
+        return run_export(
+            self.getCurrentUser(),
+            folder,
+            includeMedia,
+            includeDetections,
+            excludeBelowThreshold,
+            typeFilter,
+            self._get_queue_name(),
+        )
+
     @access.user
     @describeRoute(Description("Get available pipeline configurations"))
     def get_pipelines(self, params):
@@ -445,7 +510,10 @@ class Viame(Resource):
                     return File().download(file, headers=False)()
 
                 allFiles = [make_file_generator(item) for item in ymlItems]
-                saveTracks(folder, meva.load_kpf_as_tracks(allFiles), user)
+                tracks = meva.load_kpf_as_tracks(allFiles)
+                if 'error' in tracks:
+                    raise RestException(f"Failed to import KPF annotations: {tracks['error']}")
+                saveTracks(folder, tracks, user)
                 ymlItems.rewind()
                 for item in ymlItems:
                     Item().move(item, auxiliary)
@@ -459,6 +527,9 @@ class Viame(Resource):
         if detections_file(folder) is None:
             saveTracks(folder, {}, user)
 
+        if fromMeta(folder, TypeMarker) == ImageSequenceType and not isClone:
+            build_image_manifest(folder)
+
         return folder
 
     @access.user
@@ -529,7 +600,8 @@ class Viame(Resource):
 
     @access.user
     @autoDescribeRoute(
-        Description("").modelParam(
+        Description("List the web-safe images of a dataset in frame order")
+        .modelParam(
             "folderId",
             description="folder id of a clip",
             model=Folder,
@@ -537,9 +609,74 @@ class Viame(Resource):
             required=True,
             level=AccessType.READ,
         )
+        .param(
+            "offset",
+            "Number of images to skip",
+            paramType="query",
+            dataType="integer",
+            default=0,
+        )
+        .param(
+            "limit",
+            "Maximum number of images to return, or 0 for all",
+            paramType="query",
+            dataType="integer",
+            default=0,
+        )
+        .param(
+            "frameStart",
+            "First frame to include",
+            paramType="query",
+            dataType="integer",
+            required=False,
+        )
+        .param(
+            "frameEnd",
+            "Last frame to include",
+            paramType="query",
+            dataType="integer",
+            required=False,
+        )
+    )
+    def get_valid_images(self, folder, offset, limit, frameStart, frameEnd):
+        user = self.getCurrentUser()
+        total, images = image_manifest_page(folder, user, offset, limit, frameStart, frameEnd)
+        setResponseHeader('Girder-Total-Count', total)
+        return images
+
+    @access.user
+    @autoDescribeRoute(
+        Description("Stream the web-safe images of a dataset as one uncompressed tar")
+        .notes('Members are in frame order and named as in valid_images.')
+        .modelParam(
+            "folderId",
+            description="folder id of a clip",
+            model=Folder,
+            paramType="query",
+            required=True,
+            level=AccessType.READ,
+        )
+        .param(
+            "frameStart",
+            "First frame to include",
+            paramType="query",
+            dataType="integer",
+            required=False,
+        )
+        .param(
+            "frameEnd",
+            "Last frame to include",
+            paramType="query",
+            dataType="integer",
+            required=False,
+        )
     )
-    def get_valid_images(self, folder):
-        return valid_images(folder, self.getCurrentUser())
+    def get_image_archive(self, folder, frameStart, frameEnd):
+        if fromMeta(folder, TypeMarker) != ImageSequenceType:
+            raise RestException('Only image sequences have an image archive')
+        setResponseHeader('Content-Type', 'application/x-tar')
+        setContentDisposition(f'{folder["name"]}.tar')
+        return stream_image_archive(folder, self.getCurrentUser(), frameStart, frameEnd)
 
     @access.user
     @autoDescribeRoute(
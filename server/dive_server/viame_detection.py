@@ -3,7 +3,7 @@ from typing import List
 
 from girder.api import access
 from girder.api.describe import Description, autoDescribeRoute
-from girder.api.rest import Resource, setContentDisposition, setResponseHeader
+from girder.api.rest import Resource, setContentDisposition, setRawResponse, setResponseHeader
 from girder.constants import AccessType, TokenScope
 from girder.exceptions import RestException
 from girder.models.file import File
@@ -12,16 +12,33 @@ from girder.models.item import Item
 from girder.utility import ziputil
 
 from dive_server.utils import (
+    BulkExportCsvConcurrency,
+    TimelineMaxBucketSize,
+    dataset_stats,
     detections_file,
     detections_item,
+    detections_trusted,
+    export_cache_key,
     get_annotation_csv_generator,
+    get_annotation_kpf_generators,
     getCloneRoot,
     getTrackData,
+    occupancy_timeline_json,
+    render_annotation_csv,
     saveTracks,
+    stream_cached_export,
+    stream_materialized_export,
     verify_dataset,
+    write_through_export,
+    zip_dataset,
+)
+from dive_utils import fromMeta, models, ordered_prefetch, thresholds
+from dive_utils.constants import (
+    ConfidenceFiltersMarker,
+    ImageSequenceType,
+    TypeMarker,
+    VideoType,
 )
-from dive_utils import fromMeta, models
-from dive_utils.constants import ImageSequenceType, TypeMarker, VideoType, imageRegex, videoRegex
 
 
 class ViameDetection(Resource):
@@ -31,9 +48,15 @@ class ViameDetection(Resource):
         self.route("GET", (), self.get_detection)
         self.route("PUT", (), self.save_detection)
         self.route("GET", ("clip_meta",), self.get_clip_meta)
+        self.route("GET", ("frame",), self.get_frame_detections)
+        self.route("GET", ("threshold_count",), self.get_threshold_count)
+        self.route("GET", ("stats",), self.get_stats)
+        self.route("GET", ("timeline",), self.get_timeline)
         self.route("GET", (":id", "export"), self.get_export_urls)
         self.route("GET", (":id", "export_detections"), self.export_detections)
         self.route("GET", (":id", "export_all"), self.export_all)
+        self.route("GET", (":id", "export_kpf"), self.export_kpf)
+        self.route("GET", ("export_datasets",), self.export_datasets)
 
     def _get_clip_meta(self, folder):
         videoUrl = None
@@ -162,11 +185,15 @@ class ViameDetection(Resource):
     )
     def export_detections(self, folder, excludeBelowThreshold: bool, typeFilter: List[str]):
         verify_dataset(folder)
+        user = self.getCurrentUser()
+        key = export_cache_key(folder, user, 'csv', excludeBelowThreshold, typeFilter)
+        cached = stream_cached_export(key, folder['name'] + '.csv', 'text/csv')
+        if cached is not None:
+            return cached
         filename, gen = get_annotation_csv_generator(
-            folder, self.getCurrentUser(), excludeBelowThreshold, typeFilter
+            folder, user, excludeBelowThreshold, typeFilter
         )
-        setContentDisposition(filename)
-        return gen
+        return stream_materialized_export(key, filename, 'text/csv', gen)
 
     @access.public(scope=TokenScope.DATA_READ, cookie=True)
     @autoDescribeRoute(
@@ -217,46 +244,135 @@ class ViameDetection(Resource):
         typeFilter: List[str],
     ):
         verify_dataset(folder)
-        _, gen = get_annotation_csv_generator(
-            folder, self.getCurrentUser(), excludeBelowThreshold, typeFilter
+        user = self.getCurrentUser()
+        key = export_cache_key(
+            folder, user, 'zip', includeMedia, includeDetections, excludeBelowThreshold, typeFilter
         )
+        cached = stream_cached_export(key, folder['name'] + '.zip', 'application/zip')
+        if cached is not None:
+            return cached
+        _, gen = get_annotation_csv_generator(folder, user, excludeBelowThreshold, typeFilter)
         setResponseHeader('Content-Type', 'application/zip')
         setContentDisposition(folder['name'] + '.zip')
-        user = self.getCurrentUser()
-        mediaFolder = getCloneRoot(user, folder)
-        source_type = fromMeta(mediaFolder, TypeMarker)
-        mediaRegex = None
-        if source_type == ImageSequenceType:
-            mediaRegex = imageRegex
-        elif source_type == VideoType:
-            mediaRegex = videoRegex
 
         def stream():
             z = ziputil.ZipGenerator(folder['name'])
+            yield from zip_dataset(z, folder, user, includeMedia, includeDetections, gen)
+            yield z.footer()
 
-            if includeMedia:
-                # Add media
-                for item in Folder().childItems(
-                    mediaFolder,
-                    filters={"lowerName": {"$regex": mediaRegex}},
-                ):
-                    for (path, file) in Item().fileList(item):
-                        for data in z.addFile(file, path):
-                            yield data
-                        break  # Media items should only have 1 valid file
+        return write_through_export(key, stream)
 
+    @access.public(scope=TokenScope.DATA_READ, cookie=True)
+    @autoDescribeRoute(
+        Description("Export several datasets into one zip with a directory per dataset")
+        .jsonParam(
+            "folderIds",
+            "List of dataset folder ids",
+            paramType="query",
+            required=True,
+            requireArray=True,
+        )
+        .param(
+            "includeMedia",
+            "Include media content",
+            paramType="query",
+            dataType="boolean",
+            default=True,
+        )
+        .param(
+            "includeDetections",
+            "Include detection content",
+            paramType="query",
+            dataType="boolean",
+            default=True,
+        )
+        .param(
+            "excludeBelowThreshold",
+            "Exclude tracks with confidencePairs below set threshold",
+            paramType="query",
+            dataType="boolean",
+            default=False,
+        )
+        .jsonParam(
+            "typeFilter",
+            "List of track types to filter by",
+            paramType="query",
+            required=False,
+            default=[],
+            requireArray=True,
+        )
+    )
+    def export_datasets(
+        self,
+        folderIds: List[str],
+        includeMedia: bool,
+        includeDetections: bool,
+        excludeBelowThreshold: bool,
+        typeFilter: List[str],
+    ):
+        user = self.getCurrentUser()
+        folders = []
+        paths = []
+        for folderId in folderIds:
+            folder = Folder().load(folderId, level=AccessType.READ, user=user)
+            if folder is None:
+                raise RestException(f"Cannot access folder {folderId}")
+            verify_dataset(folder)
+            getCloneRoot(user, folder)
             if includeDetections:
-                # add JSON detections
-                for (path, file) in Folder().fileList(
+                detections_item(folder, strict=True)
+            # Datasets in different parents may share a name
+            path = folder['name']
+            if path in paths:
+                path = f"{path}_{folder['_id']}"
+            folders.append(folder)
+            paths.append(path)
+        setResponseHeader('Content-Type', 'application/zip')
+        setContentDisposition('datasets.zip')
+
+        def renderCsv(folder) -> bytes:
+            if not includeDetections:
+                return b''
+            return render_annotation_csv(folder, user, excludeBelowThreshold, typeFilter)
+
+        def stream():
+            z = ziputil.ZipGenerator()
+            # CSVs for the next datasets render while the current one streams
+            csvs = ordered_prefetch(renderCsv, folders, BulkExportCsvConcurrency)
+            for folder, path, csv in zip(folders, paths, csvs):
+                yield from zip_dataset(
+                    z,
                     folder,
-                    user=user,
-                    subpath=False,
-                    mimeFilter={'application/json'},
-                ):
-                    for data in z.addFile(file, path):
-                        yield data
-                # add CSV detections
-                for data in z.addFile(gen, "output_tracks.csv"):
+                    user,
+                    includeMedia,
+                    includeDetections,
+                    lambda csv=csv: iter([csv]),
+                    path,
+                )
+            yield z.footer()
+
+        return stream
+
+    @access.public(scope=TokenScope.DATA_READ, cookie=True)
+    @autoDescribeRoute(
+        Description("Export detections of a clip into MEVA KPF format.").modelParam(
+            "id",
+            description="folder id of a clip",
+            model=Folder,
+            required=True,
+            level=AccessType.READ,
+        )
+    )
+    def export_kpf(self, folder):
+        verify_dataset(folder)
+        generators = get_annotation_kpf_generators(folder)
+        setResponseHeader('Content-Type', 'application/zip')
+        setContentDisposition(folder['name'] + '.kpf.zip')
+
+        def stream():
+            z = ziputil.ZipGenerator(folder['name'], compression=ziputil.DEFLATE)
+            for path, gen in generators.items():
+                for data in z.addFile(gen, path):
                     yield data
             yield z.footer()
 
@@ -282,6 +398,112 @@ class ViameDetection(Resource):
             raise RestException('Cannot get detections until postprocessing is complete.')
         return File().download(file, contentDisposition="inline")
 
+    @access.user
+    @autoDescribeRoute(
+        Description("Get the detection of every track on a single frame")
+        .modelParam(
+            "folderId",
+            description="folder id of a clip",
+            model=Folder,
+            paramType="query",
+            required=True,
+            level=AccessType.READ,
+        )
+        .param(
+            "frame",
+            "Frame number, interpolated between keyframes where enabled",
+            paramType="query",
+            dataType="integer",
+            required=True,
+        )
+    )
+    def get_frame_detections(self, folder, frame: int):
+        verify_dataset(folder)
+        trusted = detections_trusted(detections_item(folder))
+        track_dict = getTrackData(detections_file(folder))
+        tracks = models.load_track_records(track_dict, trusted)
+        return {
+            str(trackId): feature.to_dict()
+            for trackId, feature in models.features_at_frame(tracks, frame).items()
+        }
+
+    @access.user
+    @autoDescribeRoute(
+        Description("Count the tracks that pass a set of confidence filters")
+        .modelParam(
+            "folderId",
+            description="folder id of a clip",
+            model=Folder,
+            paramType="query",
+            required=True,
+            level=AccessType.READ,
+        )
+        .jsonParam(
+            "confidenceFilters",
+            "Type to threshold map, including default.  Uses the saved filters if omitted",
+            paramType="query",
+            required=False,
+            requireObject=True,
+        )
+    )
+    def get_threshold_count(self, folder, confidenceFilters):
+        verify_dataset(folder)
+        if confidenceFilters is None:
+            confidenceFilters = fromMeta(folder, ConfidenceFiltersMarker, {})
+        track_dict = getTrackData(detections_file(folder))
+        arrays = thresholds.load_confidence_arrays(track_dict.values())
+        passing = thresholds.exceeds_thresholds(arrays, confidenceFilters)
+        return {
+            "total": arrays.track_count,
+            "passing": int(passing.sum()),
+        }
+
+    @access.user
+    @autoDescribeRoute(
+        Description("Statistics of the current revision of a dataset's tracks").modelParam(
+            "folderId",
+            description="folder id of a clip",
+            model=Folder,
+            paramType="query",
+            required=True,
+            level=AccessType.READ,
+        )
+    )
+    def get_stats(self, folder):
+        verify_dataset(folder)
+        return dataset_stats(folder).dict()
+
+    @access.user
+    @autoDescribeRoute(
+        Description("Count detections of each type on every frame of a dataset")
+        .notes(
+            'Frames are grouped into buckets of bucketSize, each counting the most detections'
+            ' on any one frame.  Long datasets may be returned with a larger bucket_size.'
+        )
+        .modelParam(
+            "folderId",
+            description="folder id of a clip",
+            model=Folder,
+            paramType="query",
+            required=True,
+            level=AccessType.READ,
+        )
+        .param(
+            "bucketSize",
+            "Number of frames per bucket",
+            paramType="query",
+            dataType="integer",
+            default=1,
+        )
+    )
+    def get_timeline(self, folder, bucketSize: int):
+        verify_dataset(folder)
+        if bucketSize < 1 or bucketSize > TimelineMaxBucketSize:
+            raise RestException(f'bucketSize must be between 1 and {TimelineMaxBucketSize}')
+        setResponseHeader('Content-Type', 'application/json')
+        setRawResponse()
+        return occupancy_timeline_json(folder, bucketSize)
+
     @access.user
     @autoDescribeRoute(
         Description("").modelParam(
@@ -315,6 +537,7 @@ class ViameDetection(Resource):
         user = self.getCurrentUser()
         upsert: List[dict] = tracks.get('upsert', [])
         delete: List[str] = tracks.get('delete', [])
+        trusted = detections_trusted(detections_item(folder))
         track_dict = getTrackData(detections_file(folder))
 
         for track_id in delete:
@@ -327,7 +550,9 @@ class ViameDetection(Resource):
         deleted_len = len(delete)
 
         if upserted_len or deleted_len:
-            saveTracks(folder, track_dict, user)
+            # Upserts were validated above, so only an untrusted
+            # previous revision needs to be validated again.
+            saveTracks(folder, track_dict, user, validated=trusted)
 
         return {
             "updated": upserted_len,
@@ -1,17 +1,21 @@
 import csv
 import io
-from typing import Callable, Generator, List
+from typing import Callable, Dict, Generator, List, Optional
 
+from bson.objectid import ObjectId
 from girder.api import access
 from girder.api.describe import Description, autoDescribeRoute
 from girder.api.rest import Resource, setContentDisposition
 from girder.constants import AccessType, SortDir, TokenScope
 from girder.models.folder import Folder
 from girder.models.token import Token
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
 
-from dive_server.utils import PydanticModel, detections_file, getTrackData
-from dive_tasks.summary import generate_max_n_summary, generate_summary
-from dive_utils import fromMeta, models
+from dive_server.utils import MaxNConcurrency, PydanticModel, dataset_stats
+from dive_tasks.summary import generate_summary
+from dive_utils import asbool, fromMeta, models, ordered_prefetch
+from dive_utils.constants import DatasetMarker, PublishedMarker
 from dive_utils.serializers.viame import format_timestamp
 from dive_utils.types import GirderModel
 
@@ -43,19 +47,21 @@ def generate_max_n_summary_csv(
     )
 
     def gen():
-        for folder in folders:
-            track_data = getTrackData(detections_file(folder))
+        # MaxN is kept in the stats of each revision, which are computed for cache misses
+        for folder, stats in ordered_prefetch(
+            lambda folder: (folder, dataset_stats(folder)), folders, MaxNConcurrency
+        ):
             annotation_fps = fromMeta(folder, 'fps')
-            for detection_type, result in generate_max_n_summary(track_data).items():
+            for result in stats.max_n or []:
                 writer.writerow(
                     [
                         folder['name'],
                         folder['_id'],
                         annotation_fps,
-                        format_timestamp(annotation_fps, result['frame']),
-                        result['frame'],
-                        detection_type,
-                        result['count'],
+                        format_timestamp(annotation_fps, result.frame),
+                        result.frame,
+                        result.value,
+                        result.count,
                     ]
                 )
                 yield csvFile.getvalue()
@@ -70,6 +76,113 @@ class SummaryItem(PydanticModel):
         return super().initialize("summaryItem", models.SummaryItemSchema)
 
 
+class SummaryContribution(PydanticModel):
+    def initialize(self):
+        super().initialize("summaryContribution", models.DatasetSummaryContribution)
+        self.ensureIndices([('folderId', {'unique': True})])
+
+
+def _swap_summary_contribution(
+    folderId: str, items: Dict[str, models.SummaryItemSchema]
+) -> Optional[dict]:
+    """
+    Replace one dataset's stored contribution, returning the one it replaced.
+    Each stored contribution has a unique version, and the replacement only happens
+    if the version read is still current, so concurrent saves take turns.
+    """
+    collection = SummaryContribution().collection
+    while True:
+        previous = collection.find_one({'folderId': folderId})
+        contribution = models.DatasetSummaryContribution(
+            folderId=folderId, version=str(ObjectId()), label_summary_items=list(items.values())
+        ).dict()
+        if previous is None:
+            if not items:
+                return None
+            try:
+                collection.insert_one(contribution)
+                return None
+            except DuplicateKeyError:
+                continue
+        query = {'folderId': folderId, 'version': previous.get('version')}
+        if items:
+            swapped = collection.find_one_and_replace(query, contribution)
+        else:
+            swapped = collection.find_one_and_delete(query)
+        if swapped is not None:
+            return swapped
+
+
+def apply_summary_contribution(folderId: str, items: Dict[str, models.SummaryItemSchema]):
+    """
+    Replace one dataset's contribution to the published summary,
+    applying only the difference to the summary items
+    """
+    # Only the difference between the two contributions that were swapped is applied,
+    # so concurrent saves of the same dataset each count once
+    previous = _swap_summary_contribution(folderId, items)
+    old = {item['value']: item for item in previous['label_summary_items']} if previous else {}
+    operations = []
+    for value in old.keys() | items.keys():
+        before = old.get(value, {'total_tracks': 0, 'total_detections': 0})
+        after = items.get(value)
+        tracks = (after.total_tracks if after else 0) - before['total_tracks']
+        detections = (after.total_detections if after else 0) - before['total_detections']
+        if after and value in old and not tracks and not detections:
+            continue
+        update: dict = {'$inc': {'total_tracks': tracks, 'total_detections': detections}}
+        if after:
+            update['$addToSet'] = {'found_in': folderId}
+        else:
+            update['$pull'] = {'found_in': folderId}
+        operations.append(UpdateOne({'value': value}, update, upsert=True))
+    if operations:
+        SummaryItem().collection.bulk_write(operations, ordered=False)
+        SummaryItem().collection.delete_many({'total_tracks': {'$lte': 0}})
+
+
+def summarize_dataset(stats: models.DatasetStatsSchema) -> Dict[str, models.SummaryItemSchema]:
+    """A dataset's summary items, read from the stats of its current revision"""
+    return {
+        t.value: models.SummaryItemSchema(
+            value=t.value,
+            total_tracks=t.total_tracks,
+            total_detections=t.total_detections,
+            found_in=[stats.folderId],
+        )
+        for t in stats.types
+    }
+
+
+def update_summary_on_tracks_saved(event):
+    """Apply a published dataset's new revision to the summary"""
+    folder = event.info['folder']
+    if asbool(fromMeta(folder, PublishedMarker)):
+        items = summarize_dataset(event.info['stats'])
+        apply_summary_contribution(str(folder['_id']), items)
+
+
+def update_summary_on_folder_save(event):
+    """Add or remove a dataset's contribution when it is published or unpublished"""
+    folder = event.info
+    if '_id' not in folder or not asbool(fromMeta(folder, DatasetMarker)):
+        return
+    previous = Folder().findOne({'_id': folder['_id']}, fields=['meta'])
+    published = asbool(fromMeta(folder, PublishedMarker))
+    if previous is not None and asbool(fromMeta(previous, PublishedMarker)) == published:
+        return
+    items: Dict[str, models.SummaryItemSchema] = {}
+    if published:
+        items = summarize_dataset(dataset_stats(folder))
+    apply_summary_contribution(str(folder['_id']), items)
+
+
+def update_summary_on_folder_remove(event):
+    folder = event.info
+    if asbool(fromMeta(folder, PublishedMarker)):
+        apply_summary_contribution(str(folder['_id']), {})
+
+
 class ViameSummary(Resource):
     def __init__(self):
         super(ViameSummary, self).__init__()
@@ -81,7 +194,12 @@ class ViameSummary(Resource):
         self.route("POST", ("generate",), self.regenerate_summary)
 
     @access.admin
-    @autoDescribeRoute(Description('Generate summary of published data'))
+    @autoDescribeRoute(
+        Description('Regenerate the summary of published data').notes(
+            'The summary is kept up to date as datasets are saved and published.'
+            ' Use this to repair it with a full crawl.'
+        )
+    )
     def regenerate_summary(self, params):
         user = self.getCurrentUser()
         token = Token().createToken(user=user, days=14)
@@ -100,9 +218,17 @@ class ViameSummary(Resource):
     )
     def save_summary(self, params, summary):
         validate_summary = models.PublicDataSummary(**summary)
-        SummaryItem().collection.remove({})  # drop existing summary
-        for item in validate_summary.label_summary_items:
-            SummaryItem().create(item)
+        # Replace the incrementally maintained summary with a full rebuild
+        SummaryItem().collection.delete_many({})
+        SummaryContribution().collection.delete_many({})
+        if validate_summary.label_summary_items:
+            SummaryItem().collection.insert_many(
+                [item.dict() for item in validate_summary.label_summary_items]
+            )
+        if validate_summary.contributions:
+            SummaryContribution().collection.insert_many(
+                [contribution.dict() for contribution in validate_summary.contributions]
+            )
 
     @access.user
     @autoDescribeRoute(
@@ -1,21 +1,37 @@
-from typing import Any, Dict, Set
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Set, Tuple
 
 from girder_client import GirderClient
 from girder_worker.app import app
 from girder_worker.task import Task
 
-from dive_utils.constants import PublishedMarker
-from dive_utils.models import PublicDataSummary, SummaryItemSchema, Track
+from dive_tasks.utils import pooled_session
+from dive_utils import asbool, fromMeta, ordered_prefetch
+from dive_utils.constants import PublishedMarker, ValidatedMarker
+from dive_utils.models import (
+    DatasetSummaryContribution,
+    PublicDataSummary,
+    SummaryItemSchema,
+    load_track_records,
+)
+from dive_utils.types import GirderModel
+
+# Number of published datasets fetched concurrently by generate_summary
+SUMMARY_CRAWL_CONCURRENCY = 8
+SUMMARY_PAGE_SIZE = 50
 
 
 def summarize_annotations(
-    datasetId: str, trackData: Dict[str, Any], summary: Dict[str, SummaryItemSchema]
+    datasetId: str,
+    trackData: Dict[str, Any],
+    summary: Dict[str, SummaryItemSchema],
+    trusted=False,
 ):
-    for trackdict in trackData.values():
-        track = Track(**trackdict)
+    for track in load_track_records(trackData, trusted):
         for name, _ in track.confidencePairs:
             if name in summary:
-                summary[name].found_in = list(set(summary[name].found_in + [datasetId]))
+                if datasetId not in summary[name].found_in:
+                    summary[name].found_in.append(datasetId)
                 summary[name].total_tracks += 1
                 summary[name].total_detections += len(track.features)
             else:
@@ -27,77 +43,85 @@ def summarize_annotations(
                 )
 
 
-def generate_max_n_summary(trackData: Dict[str, Any]):
-    enabled: Set[str] = set()  # the tracks that are active on the current frame
-
-    maxN: Dict[str, Dict[str, int]] = {}  # map type to tuple (frame, count)
-    currentN: Dict[str, int] = {}
-
-    for trackdict in sorted(trackData.values(), key=lambda item: item['begin']):
-        currentFrame = trackdict.get('begin')
-        trackType = sorted(
-            trackdict.get('confidencePairs', ['unknown', 1]),
-            key=lambda item: item[1],
-            reverse=True,
-        )[0][0]
-
-        # Decrement tracks that need to be turned off before the next count round
-        for enabledtrackId in list(enabled):
-            enabledtrackdict = trackData[str(enabledtrackId)]
-            if enabledtrackdict.get('end') < currentFrame:
-                enabled.remove(enabledtrackId)
-                enabledTrackType = sorted(
-                    enabledtrackdict.get('confidencePairs', ['unknown', 1]),
-                    key=lambda item: item[1],
-                    reverse=True,
-                )[0][0]
-                currentN[enabledTrackType] -= 1
-
-        # Figure out if we're at a global maximum
-        currentN[trackType] = currentN.get(trackType, 0) + 1  # Increment the current
-        currentMax = maxN.get(trackType, {"frame": 0, "count": 0})
-        if currentN[trackType] > currentMax["count"]:
-            maxN[trackType] = {"frame": currentFrame, "count": currentN[trackType]}
-
-        enabled.add(str(trackdict['trackId']))
-
-    return maxN
-
-
-@app.task(bind=True, acks_late=True)
-def generate_summary(self: Task):
-    gc: GirderClient = self.girder_client
-
-    limit = 50
+def merge_summary(
+    summary: Dict[str, SummaryItemSchema],
+    found_in: Dict[str, Set[str]],
+    other: Dict[str, SummaryItemSchema],
+):
+    """
+    Add other into summary. Datasets are collected in found_in rather than
+    summary, so merging stays linear in the number of datasets.
+    """
+    for name, item in other.items():
+        found_in[name].update(item.found_in)
+        if name in summary:
+            summary[name].total_tracks += item.total_tracks
+            summary[name].total_detections += item.total_detections
+        else:
+            summary[name] = item.copy(update={'found_in': []})
+
+
+def published_datasets(gc: GirderClient) -> Iterator[GirderModel]:
     offset = 0
-    total = int(
-        gc.get(
-            'viame/datasets',
-            parameters={'limit': 1, PublishedMarker: True},
-            jsonResp=False,
-        ).headers['girder-total-count']
-    )
-    print(limit, offset, total)
-
-    summary: Dict[str, SummaryItemSchema] = {}
-    while offset < total:
+    while True:
         page = gc.get(
             'viame/datasets',
             parameters={
-                'limit': limit,
+                'limit': SUMMARY_PAGE_SIZE,
                 'offset': offset,
                 PublishedMarker: True,
             },
         )
-        offset += limit
-        for dataset in page:
-            summarize_annotations(
-                dataset['_id'],
-                gc.get('viame_detection', parameters={'folderId': dataset['_id']}),
-                summary,
-            )
-    print(summary)
+        yield from page
+        if len(page) < SUMMARY_PAGE_SIZE:
+            return
+        offset += len(page)
+
+
+def summarize_published_dataset(
+    gc: GirderClient, dataset: GirderModel
+) -> Tuple[str, Dict[str, SummaryItemSchema]]:
+    detection = gc.get('viame_detection/clip_meta', parameters={'folderId': dataset['_id']})[
+        'detection'
+    ]
+    contribution: Dict[str, SummaryItemSchema] = {}
+    summarize_annotations(
+        dataset['_id'],
+        gc.get('viame_detection', parameters={'folderId': dataset['_id']}),
+        contribution,
+        trusted=detection is not None and asbool(fromMeta(detection, ValidatedMarker)),
+    )
+    return dataset['_id'], contribution
+
+
+@app.task(bind=True, acks_late=True)
+def generate_summary(self: Task):
+    gc: GirderClient = self.girder_client
+
+    summary: Dict[str, SummaryItemSchema] = {}
+    found_in: Dict[str, Set[str]] = defaultdict(set)
+    contributions: List[DatasetSummaryContribution] = []
+    with pooled_session(gc, SUMMARY_CRAWL_CONCURRENCY):
+        for datasetId, contribution in ordered_prefetch(
+            lambda dataset: summarize_published_dataset(gc, dataset),
+            published_datasets(gc),
+            SUMMARY_CRAWL_CONCURRENCY,
+        ):
+            merge_summary(summary, found_in, contribution)
+            if contribution:
+                contributions.append(
+                    DatasetSummaryContribution(
+                        folderId=datasetId,
+                        label_summary_items=list(contribution.values()),
+                    )
+                )
+    for name, item in summary.items():
+        item.found_in = sorted(found_in[name])
+    print(f'Summarized {len(contributions)} datasets')
     gc.post(
         'viame_summary',
-        data=PublicDataSummary(label_summary_items=list(summary.values())).json(),
+        data=PublicDataSummary(
+            label_summary_items=list(summary.values()),
+            contributions=contributions,
+        ).json(),
     )
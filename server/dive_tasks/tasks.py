@@ -3,12 +3,14 @@ import json
 import math
 import os
 from pathlib import Path
+import queue
 import shlex
 import shutil
 import subprocess
 from subprocess import Popen
 import tempfile
-from typing import Dict, List, Tuple
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from urllib import request
 from urllib.parse import urlparse
 import zipfile
@@ -24,12 +26,16 @@ from dive_tasks.pipeline_discovery import discover_configs
 from dive_tasks.utils import (
     check_canceled,
     download_source_media,
+    iter_images,
     organize_folder_for_training,
+    pooled_session,
     stream_subprocess,
+    with_retries,
 )
-from dive_utils import fromMeta
+from dive_utils import fromMeta, ordered_prefetch
 from dive_utils.constants import (
     DatasetMarker,
+    DetectorPipelineCategory,
     FPSMarker,
     ImageSequenceType,
     OriginalFPSMarker,
@@ -40,8 +46,16 @@ from dive_utils.constants import (
     VideoType,
     imageRegex,
     safeImageRegex,
+    videoRegex,
+)
+from dive_utils.serializers.viame import merge_csv_chunks
+from dive_utils.types import (
+    AvailableJobSchema,
+    ExportJob,
+    GirderModel,
+    PipelineDescription,
+    PipelineJob,
 )
-from dive_utils.types import AvailableJobSchema, GirderModel, PipelineJob
 
 EMPTY_JOB_SCHEMA: AvailableJobSchema = {
     'pipelines': {},
@@ -50,6 +64,20 @@ EMPTY_JOB_SCHEMA: AvailableJobSchema = {
         'default': None,
     },
 }
+# Number of media items an export job downloads ahead of the archive writer
+EXPORT_DOWNLOAD_CONCURRENCY = 4
+# Number of images convert_images downloads, and separately uploads, concurrently.
+# Conversion runs one ffmpeg process per CPU.
+CONVERT_TRANSFER_CONCURRENCY = 4
+# Detector pipelines run on image sequences in chunks while the rest of the sequence
+# downloads.  Every chunk restarts kwiver and reloads its model, so chunks start small
+# for an early start and then grow, which keeps the number of restarts logarithmic.
+PIPELINE_FIRST_CHUNK_SIZE = 1000
+PIPELINE_CHUNK_GROWTH = 2
+# Downloaded chunks that may wait for the pipeline before downloading pauses
+PIPELINE_CHUNK_QUEUE_SIZE = 1
+# Seconds between cancellation checks while waiting for a chunk to download
+PIPELINE_CHUNK_WAIT = 5
 UPGRADE_JOB_DEFAULT_URLS: List[str] = [
     'https://data.kitware.com/api/v1/item/6011e3452fa25629b91ade60/download',  # Habcam
     'https://viame.kitware.com/api/v1/item/604859fc5b1737bb9085f5e2/download',  # SEFSC
@@ -227,9 +255,32 @@ def run_pipeline(self: Task, params: PipelineJob):
         f" Job asked for {pipeline_path} but it does not exist"
     )
 
-    # Download source media
     input_folder: GirderModel = gc.getFolder(input_folder_id)
-    input_media_list = download_source_media(gc, input_folder, input_path)
+    if (
+        input_type == ImageSequenceType
+        and pipeline["type"] == DetectorPipelineCategory
+        and pipeline_input is None
+    ):
+        # Frames are independent, so detection can start before the download finishes
+        manager.updateStatus(JobStatus.RUNNING)
+        chunked_output = run_pipeline_in_chunks(
+            self,
+            context,
+            manager,
+            conf,
+            input_folder,
+            pipeline_path,
+            input_path,
+            misc_path,
+            cleanup,
+        )
+        if chunked_output is None:
+            return
+        push_pipeline_output(gc, manager, pipeline, output_folder_id, chunked_output)
+        return
+
+    # Download source media
+    input_media_list = download_source_media(gc, input_folder, input_path, manager)
 
     if input_type == VideoType:
         input_fps = fromMeta(input_folder, FPSMarker)
@@ -248,15 +299,9 @@ def run_pipeline(self: Task, params: PipelineJob):
     elif input_type == ImageSequenceType:
         with open(img_list_path, "w+") as img_list_file:
             img_list_file.write('\n'.join(input_media_list))
-        command = [
-            f". {shlex.quote(str(conf.viame_setup_script))} &&",
-            f"KWIVER_DEFAULT_LOG_LEVEL={shlex.quote(conf.kwiver_log_level)}",
-            "kwiver runner",
-            f"-p {shlex.quote(str(pipeline_path))}",
-            f"-s input:video_filename={shlex.quote(str(img_list_path))}",
-            f"-s detector_writer:file_name={shlex.quote(detector_output_file)}",
-            f"-s track_writer:file_name={shlex.quote(track_output_file)}",
-        ]
+        command = image_list_command(
+            conf, pipeline_path, img_list_path, detector_output_file, track_output_file
+        )
     else:
         raise ValueError('Unknown input type: {}'.format(input_type))
 
@@ -286,11 +331,42 @@ def run_pipeline(self: Task, params: PipelineJob):
     if check_canceled(self, context):
         return
 
+    output_path = pipeline_output_file(detector_output_file, track_output_file)
+    push_pipeline_output(gc, manager, pipeline, output_folder_id, output_path)
+
+
+def image_list_command(
+    conf: Config,
+    pipeline_path: Path,
+    img_list_path: Path,
+    detector_output_file: str,
+    track_output_file: str,
+) -> List[str]:
+    return [
+        f". {shlex.quote(str(conf.viame_setup_script))} &&",
+        f"KWIVER_DEFAULT_LOG_LEVEL={shlex.quote(conf.kwiver_log_level)}",
+        "kwiver runner",
+        f"-p {shlex.quote(str(pipeline_path))}",
+        f"-s input:video_filename={shlex.quote(str(img_list_path))}",
+        f"-s detector_writer:file_name={shlex.quote(detector_output_file)}",
+        f"-s track_writer:file_name={shlex.quote(track_output_file)}",
+    ]
+
+
+def pipeline_output_file(detector_output_file: str, track_output_file: str) -> str:
+    """Prefer track output, for pipelines that write both"""
     if Path(track_output_file).exists() and os.path.getsize(track_output_file):
-        output_path = track_output_file
-    else:
-        output_path = detector_output_file
+        return track_output_file
+    return detector_output_file
 
+
+def push_pipeline_output(
+    gc: GirderClient,
+    manager: JobManager,
+    pipeline: PipelineDescription,
+    output_folder_id: str,
+    output_path: str,
+):
     manager.updateStatus(JobStatus.PUSHING_OUTPUT)
     newfile = gc.uploadFileToFolder(output_folder_id, output_path)
 
@@ -298,6 +374,144 @@ def run_pipeline(self: Task, params: PipelineJob):
     gc.post(f'viame/postprocess/{output_folder_id}', data={"skipJobs": True})
 
 
+def produce_chunks(
+    images: Callable[[], Iterator[str]],
+    size: int,
+    chunks: queue.Queue,
+    stop: threading.Event,
+):
+    """
+    Put consecutive lists of downloaded paths on chunks, followed by None,
+    or by the exception that ended the download.
+    Chunks start at size paths and grow by PIPELINE_CHUNK_GROWTH.
+    Downloads still running when stop is set finish before this returns.
+    """
+    try:
+        with contextlib.closing(images()) as paths:
+            chunk: List[str] = []
+            for path in paths:
+                if stop.is_set():
+                    return
+                chunk.append(path)
+                if len(chunk) == size:
+                    chunks.put(chunk)
+                    chunk = []
+                    size *= PIPELINE_CHUNK_GROWTH
+            if chunk:
+                chunks.put(chunk)
+        chunks.put(None)
+    except Exception as err:
+        chunks.put(err)
+
+
+def stop_producer(producer: threading.Thread, chunks: queue.Queue, stop: threading.Event):
+    """Stop produce_chunks and wait for it, discarding chunks it is blocked on putting"""
+    stop.set()
+    while producer.is_alive():
+        with contextlib.suppress(queue.Empty):
+            while True:
+                chunks.get_nowait()
+        producer.join(timeout=0.1)
+
+
+def run_pipeline_in_chunks(
+    task: Task,
+    context: dict,
+    manager: JobManager,
+    conf: Config,
+    input_folder: GirderModel,
+    pipeline_path: Path,
+    input_path: Path,
+    misc_path: Path,
+    cleanup: Callable,
+) -> Optional[str]:
+    """
+    Run a detector pipeline on consecutive chunks of an image sequence,
+    starting each run as soon as its images are downloaded.
+    Returns the merged output, or None if the job was canceled.
+    cleanup is called on failure or cancellation, once downloads have stopped.
+    """
+    gc: GirderClient = task.girder_client
+    image_items = gc.get('viame/valid_images', {'folderId': input_folder['_id']})
+    chunks: queue.Queue = queue.Queue(maxsize=PIPELINE_CHUNK_QUEUE_SIZE)
+    stop = threading.Event()
+    producer = threading.Thread(
+        target=produce_chunks,
+        args=(
+            lambda: iter_images(gc, image_items, input_path),
+            PIPELINE_FIRST_CHUNK_SIZE,
+            chunks,
+            stop,
+        ),
+        daemon=True,
+    )
+    producer.start()
+
+    outputs: List[Tuple[int, str]] = []
+    processed = 0
+    completed = False
+    try:
+        while True:
+            try:
+                chunk = chunks.get(timeout=PIPELINE_CHUNK_WAIT)
+            except queue.Empty:
+                if check_canceled(task, context, force=False):
+                    manager.updateStatus(JobStatus.CANCELED)
+                    return None
+                continue
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            index = len(outputs)
+            img_list_path = misc_path / f'img_list_file_{index}.txt'
+            detector_output_file = str(misc_path / f'detector_output_{index}.csv')
+            track_output_file = str(misc_path / f'track_output_{index}.csv')
+            img_list_path.write_text('\n'.join(chunk))
+            cmd = " ".join(
+                image_list_command(
+                    conf, pipeline_path, img_list_path, detector_output_file, track_output_file
+                )
+            )
+            manager.write(
+                f"Running frames {processed} to {processed + len(chunk) - 1}: {cmd}\n",
+                forceFlush=True,
+            )
+            process_err_file = tempfile.TemporaryFile()
+            process = Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=process_err_file,
+                shell=True,
+                executable='/bin/bash',
+                env=conf.gpu_process_env,
+            )
+            # Cleanup waits until downloads into input_path have stopped
+            stream_subprocess(process, task, context, manager, process_err_file)
+            if check_canceled(task, context):
+                return None
+            outputs.append(
+                (processed, pipeline_output_file(detector_output_file, track_output_file))
+            )
+            processed += len(chunk)
+            manager.updateProgress(
+                total=len(image_items), current=processed, message=f'Processed {processed} frames'
+            )
+        completed = True
+    finally:
+        stop_producer(producer, chunks, stop)
+        if not completed:
+            cleanup()
+
+    output_path = str(misc_path / 'detector_output.csv')
+    with open(output_path, 'w') as output_file:
+        for line in merge_csv_chunks(
+            (first, Path(path).read_text().splitlines()) for first, path in outputs
+        ):
+            output_file.write(line)
+    return output_path
+
+
 @app.task(bind=True, acks_late=True, ignore_result=True)
 def train_pipeline(
     self: Task,
@@ -356,7 +570,7 @@ def train_pipeline(
                 download_path, download_path / groundtruth["name"]
             )
             # Download input media
-            input_media_list = download_source_media(gc, source_folder, download_path)
+            input_media_list = download_source_media(gc, source_folder, download_path, manager)
             if fromMeta(source_folder, TypeMarker) == VideoType:
                 download_path = Path(input_media_list[0])
             # Set media source location
@@ -579,32 +793,177 @@ def convert_images(self: Task, folderId):
         if ((imageRegex.search(item["name"]) and not safeImageRegex.search(item["name"])))
     ]
 
+    total = len(items_to_convert)
     count = 0
+    canceled = False
     with tempfile.TemporaryDirectory() as temp:
         dest_dir = Path(temp)
 
-        for item in items_to_convert:
+        def download(item: GirderModel) -> Tuple[GirderModel, Path]:
+            # Each item gets its own directory, so images that convert to the same name
+            # cannot collide
+            item_dir = dest_dir / str(item["_id"])
+            item_dir.mkdir()
             # Assumes 1 file per item
-            gc.downloadItem(item["_id"], dest_dir, item["name"])
-
-            item_path = dest_dir / item["name"]
-            new_item_path = dest_dir / ".".join([*item["name"].split(".")[:-1], "png"])
+            with_retries(lambda: gc.downloadItem(item["_id"], item_dir, item["name"]))
+            return item, item_dir / item["name"]
 
-            process_err_file = tempfile.TemporaryFile()
-            process = Popen(
+        def convert(downloaded: Tuple[GirderModel, Path]) -> Tuple[GirderModel, Path]:
+            item, item_path = downloaded
+            new_item_path = item_path.parent / ".".join([*item["name"].split(".")[:-1], "png"])
+            process = subprocess.run(
                 ["ffmpeg", "-i", item_path, new_item_path],
-                stdout=subprocess.PIPE,
-                stderr=process_err_file,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
             )
-            stream_subprocess(process, self, context, manager, process_err_file)
-            if check_canceled(self, context):
-                return
-
-            gc.uploadFileToFolder(folderId, new_item_path)
+            item_path.unlink()
+            if process.returncode != 0:
+                raise RuntimeError(
+                    f'ffmpeg failed to convert {item["name"]}: {process.stderr.decode()}'
+                )
+            return item, new_item_path
+
+        def upload(converted: Tuple[GirderModel, Path]) -> GirderModel:
+            item, new_item_path = converted
+            gc.uploadFileToFolder(folderId, str(new_item_path))
             gc.delete(f"item/{item['_id']}")
-            count += 1
+            shutil.rmtree(new_item_path.parent)
+            return item
+
+        # Each stage keeps a bounded number of images in flight, pulling from the one before.
+        # On exit the stages are closed from last to first, and closing one waits for its
+        # running calls, so nothing touches temp or the original items after this block.
+        with pooled_session(gc, 2 * CONVERT_TRANSFER_CONCURRENCY), contextlib.ExitStack() as stages:
+            downloaded = stages.enter_context(
+                contextlib.closing(
+                    ordered_prefetch(download, items_to_convert, CONVERT_TRANSFER_CONCURRENCY)
+                )
+            )
+            converted = stages.enter_context(
+                contextlib.closing(ordered_prefetch(convert, downloaded, os.cpu_count() or 1))
+            )
+            uploaded = stages.enter_context(
+                contextlib.closing(
+                    ordered_prefetch(upload, converted, CONVERT_TRANSFER_CONCURRENCY)
+                )
+            )
+            for item in uploaded:
+                count += 1
+                manager.updateProgress(
+                    total=total, current=count, message=f'Converted {item["name"]}'
+                )
+                if check_canceled(self, context, force=False):
+                    canceled = True
+                    break
+
+    if canceled:
+        manager.updateStatus(JobStatus.CANCELED)
+        return
 
     gc.addMetadataToFolder(
         str(folderId),
         {"annotate": True},  # mark the parent folder as able to annotate.
     )
+
+
+@app.task(bind=True, acks_late=True, ignore_result=True)
+def export_dataset(self: Task, params: ExportJob):
+    """
+    Assemble a dataset export archive and upload it to the output folder.
+    Media is stored and annotations are deflated, matching export_all.
+    """
+    context: dict = {}
+    gc: GirderClient = self.girder_client
+    manager: JobManager = patch_manager(self.job_manager)
+    if check_canceled(self, context):
+        manager.updateStatus(JobStatus.CANCELED)
+        return
+
+    folder_id = params["input_folder"]
+    folder: GirderModel = gc.getFolder(folder_id)
+    clip_meta = gc.get("viame_detection/clip_meta", {'folderId': folder_id})
+    media: List[GirderModel] = []
+    if params["include_media"]:
+        # Select media items as zip_dataset does, so both exports hold the same files
+        media_folder: GirderModel = gc.getFolder(params["media_folder"])
+        source_type = fromMeta(media_folder, TypeMarker)
+        media_regex = None
+        if source_type == ImageSequenceType:
+            media_regex = imageRegex
+        elif source_type == VideoType:
+            media_regex = videoRegex
+        if media_regex is not None:
+            media = [
+                item
+                for item in gc.listItem(params["media_folder"])
+                if media_regex.search(item['name'])
+            ]
+    detection_files: List[GirderModel] = []
+    if params["include_detections"] and clip_meta['detection'] is not None:
+        detection_files = list(gc.listFile(str(clip_meta['detection']['_id'])))
+
+    total = len(media) + len(detection_files) + (1 if params["include_detections"] else 0)
+    manager.updateStatus(JobStatus.RUNNING)
+
+    with tempfile.TemporaryDirectory() as _temp_dir_string:
+        temp_dir = Path(_temp_dir_string)
+        download_dir = temp_dir / 'download'
+        download_dir.mkdir()
+        archive_path = temp_dir / f"{folder['name']}.zip"
+
+        def download(model: GirderModel) -> Path:
+            path = download_dir / model['name']
+            if 'itemId' in model:
+                gc.downloadFile(str(model['_id']), str(path))
+            else:
+                gc.downloadItem(str(model['_id']), str(download_dir))
+            return path
+
+        with zipfile.ZipFile(archive_path, 'w', allowZip64=True) as archive:
+            count = 0
+            for path in ordered_prefetch(download, media, EXPORT_DOWNLOAD_CONCURRENCY):
+                archive.write(path, f"{folder['name']}/{path.name}", zipfile.ZIP_STORED)
+                path.unlink()
+                count += 1
+                manager.updateProgress(total=total, current=count, message=path.name)
+                if check_canceled(self, context, force=False):
+                    manager.updateStatus(JobStatus.CANCELED)
+                    return
+
+            for detection_file in detection_files:
+                path = download(detection_file)
+                archive.write(path, f"{folder['name']}/{path.name}", zipfile.ZIP_DEFLATED)
+                count += 1
+                manager.updateProgress(total=total, current=count, message=path.name)
+
+            if params["include_detections"]:
+                csv_path = download_dir / 'output_tracks.csv'
+                response = gc.sendRestRequest(
+                    'GET',
+                    f'viame_detection/{folder_id}/export_detections',
+                    {
+                        'excludeBelowThreshold': params["exclude_below_threshold"],
+                        'typeFilter': json.dumps(params["type_filter"]),
+                    },
+                    jsonResp=False,
+                    stream=True,
+                )
+                with open(csv_path, 'wb') as csv_file:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        csv_file.write(chunk)
+                archive.write(csv_path, f"{folder['name']}/{csv_path.name}", zipfile.ZIP_DEFLATED)
+                count += 1
+                manager.updateProgress(total=total, current=count, message=csv_path.name)
+
+        if check_canceled(self, context):
+            manager.updateStatus(JobStatus.CANCELED)
+            return
+
+        manager.updateStatus(JobStatus.PUSHING_OUTPUT)
+        new_file = gc.uploadFileToFolder(params["output_folder"], str(archive_path))
+        gc.addMetadataToItem(str(new_file['itemId']), {"export_source": folder_id})
+        manager.write(
+            f"Export complete. Download from /api/v1/file/{new_file['_id']}/download\n",
+            forceFlush=True,
+        )
@@ -1,23 +1,58 @@
+import contextlib
 from datetime import datetime, timedelta
+import os
 from pathlib import Path
 import shutil
 import signal
 from subprocess import Popen
-from tempfile import mktemp
-from typing import IO, Callable, List, Optional
+import tarfile
+from tempfile import gettempdir, mktemp
+import time
+from typing import IO, Callable, Iterator, List, Optional, TypeVar
 
-from girder_client import GirderClient
+from girder_client import GirderClient, HttpError
 from girder_worker.task import Task
 from girder_worker.utils import JobManager, JobStatus
+import requests
+from requests.adapters import HTTPAdapter
+import urllib3
 
-from dive_utils import fromMeta
+from dive_utils import fromMeta, ordered_prefetch
 from dive_utils.constants import ImageSequenceType, TypeMarker, VideoType
+from dive_utils.media_cache import IncompleteDownload, MediaCache
+from dive_utils.tarstream import extract_expected
 from dive_utils.types import GirderModel
 
 TIMEOUT_COUNT = 'timeout_count'
 TIMEOUT_LAST_CHECKED = 'last_checked'
 TIMEOUT_CHECK_INTERVAL = 30
 
+# Source media can be kept on local disk between jobs, evicted least recently used first.
+# The cache is disabled unless DIVE_MEDIA_CACHE_SIZE gives it a quota in bytes.
+media_cache = MediaCache(
+    os.environ.get('DIVE_MEDIA_CACHE_DIR', os.path.join(gettempdir(), 'dive_media_cache')),
+    int(os.environ.get('DIVE_MEDIA_CACHE_SIZE') or 0),
+)
+
+# Number of images download_source_media fetches concurrently
+DOWNLOAD_CONCURRENCY = 8
+DOWNLOAD_ATTEMPTS = 3
+# Seconds to wait before retrying a failed download, doubled after each attempt
+DOWNLOAD_RETRY_DELAY = 2
+# Image sequences with smaller images on average are fetched as a single tar stream
+ARCHIVE_MAX_MEAN_IMAGE_SIZE = 1024 * 1024
+
+# Failures that a later attempt at the same download may not hit.  Streamed bodies
+# raise urllib3 errors when the connection breaks, and archives raise tarfile errors.
+RETRYABLE_DOWNLOAD_ERRORS = (
+    requests.RequestException,
+    urllib3.exceptions.HTTPError,
+    tarfile.TarError,
+    IncompleteDownload,
+)
+
+T = TypeVar('T')
+
 
 def check_canceled(task: Task, context: dict, force=True):
     """
@@ -137,21 +172,130 @@ def organize_folder_for_training(data_dir: Path, downloaded_groundtruth: Path):
     return groundtruth
 
 
+@contextlib.contextmanager
+def pooled_session(girder_client: GirderClient, pool_size: int) -> Iterator[None]:
+    """Reuse keep-alive connections for requests made from up to pool_size threads"""
+    with girder_client.session() as session:
+        adapter = HTTPAdapter(pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        yield
+
+
+def with_retries(fn: Callable[[], T]) -> T:
+    """Call fn, retrying connection failures and server errors with backoff"""
+    delay = DOWNLOAD_RETRY_DELAY
+    for attempt in range(1, DOWNLOAD_ATTEMPTS):
+        try:
+            return fn()
+        except RETRYABLE_DOWNLOAD_ERRORS as err:
+            if isinstance(err, HttpError) and err.status < 500:
+                raise
+            print(f'Download attempt {attempt} failed, retrying in {delay}s: {err}')
+            time.sleep(delay)
+            delay *= 2
+    return fn()
+
+
+def fetch_file(
+    girder_client: GirderClient, fileId: str, sha512: Optional[str], size: int, dest: Path
+):
+    """Download a file from girder to dest through the worker's media cache"""
+    with_retries(
+        lambda: media_cache.fetch(
+            fileId,
+            sha512,
+            size,
+            dest,
+            lambda path: girder_client.downloadFile(fileId, str(path)),
+        )
+    )
+
+
+def report_download(manager: Optional[JobManager], total: int, current: int, name: str):
+    if manager is not None:
+        manager.updateProgress(total=total, current=current, message=f'Downloaded {name}')
+
+
+def iter_images(
+    girder_client: GirderClient,
+    image_items: List[GirderModel],
+    dest: Path,
+    manager: Optional[JobManager] = None,
+) -> Iterator[str]:
+    """Fetch images concurrently through the media cache, yielding each path in order"""
+
+    def download(item: GirderModel) -> str:
+        path = dest / item['name']
+        if item.get('fileId'):
+            fetch_file(girder_client, item['fileId'], item.get('sha512'), item['size'], path)
+        else:
+            # Manifests built before file ids were recorded
+            with_retries(lambda: girder_client.downloadItem(str(item["_id"]), str(dest)))
+        return str(path)
+
+    with pooled_session(girder_client, DOWNLOAD_CONCURRENCY):
+        for index, path in enumerate(
+            ordered_prefetch(download, image_items, DOWNLOAD_CONCURRENCY), start=1
+        ):
+            report_download(manager, len(image_items), index, Path(path).name)
+            yield path
+
+
+def download_image_archive(
+    girder_client: GirderClient,
+    folder: GirderModel,
+    dest: Path,
+    image_items: List[GirderModel],
+    manager: Optional[JobManager] = None,
+) -> List[str]:
+    """
+    Fetch every image of a sequence in one tar stream, extracting files as they arrive.
+    Raises a tarfile error unless the archive holds exactly image_items, in order.
+    """
+    response = girder_client.sendRestRequest(
+        'GET',
+        'viame/image_archive',
+        {'folderId': folder['_id']},
+        jsonResp=False,
+        stream=True,
+    )
+    paths: List[str] = []
+    with response:
+        response.raw.decode_content = True
+        names = [item['name'] for item in image_items]
+        for path in extract_expected(response.raw, dest, names):
+            paths.append(str(path))
+            report_download(manager, len(image_items), len(paths), path.name)
+    return paths
+
+
 def download_source_media(
-    girder_client: GirderClient, folder: GirderModel, dest: Path
+    girder_client: GirderClient,
+    folder: GirderModel,
+    dest: Path,
+    manager: Optional[JobManager] = None,
 ) -> List[str]:
     """
-    Download source media for folder from girder
+    Download source media for folder from girder.
+    Images are returned in frame order.  Sequences of small images are fetched
+    as one archive, and larger images are fetched concurrently and cached.
     """
     if fromMeta(folder, TypeMarker) == ImageSequenceType:
         image_items = girder_client.get('viame/valid_images', {'folderId': folder["_id"]})
-        for item in image_items:
-            girder_client.downloadItem(str(item["_id"]), str(dest))
-        return [str(dest / item['name']) for item in image_items]
+        total_size = sum(item['size'] for item in image_items)
+        if image_items and total_size <= ARCHIVE_MAX_MEAN_IMAGE_SIZE * len(image_items):
+            return with_retries(
+                lambda: download_image_archive(girder_client, folder, dest, image_items, manager)
+            )
+        return list(iter_images(girder_client, image_items, dest, manager))
     elif fromMeta(folder, TypeMarker) == VideoType:
         clip_meta = girder_client.get("viame_detection/clip_meta", {'folderId': folder['_id']})
-        destination_path = str(dest / clip_meta['video']['name'])
-        girder_client.downloadFile(str(clip_meta['video']['_id']), destination_path)
-        return [destination_path]
+        video = clip_meta['video']
+        destination_path = dest / video['name']
+        fetch_file(
+            girder_client, str(video['_id']), video.get('sha512'), video['size'], destination_path
+        )
+        return [str(destination_path)]
     else:
         raise Exception(f"unexpected folder {str(folder)}")
@@ -1,7 +1,9 @@
 """Utilities that are common to both the viame server and tasks package."""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import itertools
 import re
-from typing import Any, Dict, List, Union
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, TypeVar, Union
 
 from dive_utils.types import GirderModel
 
@@ -9,6 +11,9 @@ TRUTHY_META_VALUES = ['yes', '1', 1, 'true', 't', 'True', True]
 NUMBERS_REGEX = re.compile(r'(\d+)')
 NOT_NUMBERS_REGEX = re.compile(r'[^\d]+')
 
+T = TypeVar('T')
+R = TypeVar('R')
+
 
 def asbool(value: Union[str, None, bool]) -> bool:
     """Convert freeform mongo metadata value into a boolean"""
@@ -60,3 +65,29 @@ def strNumericCompare(input1: str, input2: str) -> int:
             return 1
         return 1 if a > b else -1
     return 0
+
+
+def ordered_prefetch(fn: Callable[[T], R], inputs: Iterable[T], concurrency: int) -> Iterator[R]:
+    """
+    Lazily map fn over inputs on a thread pool, yielding results in input order.
+    At most `concurrency` calls are in flight or buffered at any time, so a slow
+    consumer applies backpressure instead of accumulating results in memory.
+    Closing the generator waits for calls already running, so none outlive it.
+    """
+    if concurrency <= 1:
+        yield from map(fn, inputs)
+        return
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    pending: Deque = deque()
+    try:
+        for value in inputs:
+            pending.append(executor.submit(fn, value))
+            if len(pending) >= concurrency:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Consumer stopped early or a call raised; abandon the read-ahead that has not started
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
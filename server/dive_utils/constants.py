@@ -63,6 +63,8 @@ VideoMimeTypes = {
 # Metadata markers
 DatasetMarker = "annotate"
 DetectionMarker = "detection"
+# Set on a detection item whose tracks were validated when it was saved
+ValidatedMarker = "validated"
 PublishedMarker = "published"
 ForeignMediaIdMarker = "foreign_media_id"
 TrainedPipelineMarker = "trained_pipeline"
@@ -76,6 +78,8 @@ ConfidenceFiltersMarker = "confidenceFilters"
 
 # Other constants
 TrainedPipelineCategory = "trained"
+# Static detector pipelines, which process each frame independently
+DetectorPipelineCategory = "detector"
 
 # The name of the folder where any user specific data should be stored
 # (created as a folder of that user)
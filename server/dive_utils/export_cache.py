@@ -0,0 +1,154 @@
+"""
+Size-bounded LRU cache of generated export artifacts on local disk.
+Entries are written through while an export streams to its first client
+and served as plain files afterward.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple, Union
+
+PartialSuffix = '.partial'
+ReadChunkSize = 1024 * 1024
+
+
+class ExportCache:
+    def __init__(self, root: Union[str, Path], max_size: int):
+        self.root = Path(root)
+        self.max_size = max_size
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Hash any JSON-serializable description of an export into a cache key"""
+        description = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """
+        Open a cached entry for reading and mark it recently used.
+        The open handle remains valid if the entry is evicted while streaming.
+        """
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            os.utime(path)
+            return open(path, 'rb')
+        except FileNotFoundError:
+            return None
+
+    def write_through(self, key: str, chunks: Iterable[Union[str, bytes]]) -> Iterator[bytes]:
+        """
+        Yield chunks unchanged while copying them into the cache.
+        The entry is only committed if the stream is consumed to the end,
+        and is abandoned if it grows larger than the whole cache.
+        """
+        fp = None
+        if self.enabled:
+            self.root.mkdir(parents=True, exist_ok=True)
+            fp = tempfile.NamedTemporaryFile(dir=self.root, suffix=PartialSuffix, delete=False)
+        size = 0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf8')
+                if fp is not None:
+                    size += len(chunk)
+                    if size > self.max_size:
+                        fp.close()
+                        os.unlink(fp.name)
+                        fp = None
+                    else:
+                        fp.write(chunk)
+                yield chunk
+            if fp is not None:
+                fp.close()
+                os.replace(fp.name, self._path(key))
+                fp = None
+                self.evict()
+        finally:
+            if fp is not None:
+                fp.close()
+                os.unlink(fp.name)
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_size"""
+        entries = []
+        for path in self.root.iterdir():
+            if path.suffix == PartialSuffix:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def read_range(fp: BinaryIO, offset: int, endByte: int) -> Iterator[bytes]:
+    """Stream bytes [offset, endByte) of an open file, then close it"""
+    with fp:
+        fp.seek(offset)
+        remaining = endByte - offset
+        while remaining > 0:
+            data = fp.read(min(ReadChunkSize, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def resolve_range(
+    size: int, rangeHeader: Optional[str], ifRange: Optional[str], etag: str
+) -> Tuple[int, int, int]:
+    """
+    Decide how to answer a request for an entry of size bytes, as (status, offset, endByte).
+
+    Only a single range is served, as with girder file downloads. A malformed Range,
+    or an If-Range that does not match etag, is ignored and the whole entry is sent.
+    """
+    if not rangeHeader or (ifRange is not None and ifRange != etag):
+        return 200, 0, size
+    unit, _, specs = rangeHeader.partition('=')
+    if unit.strip() != 'bytes':
+        return 200, 0, size
+    satisfiable = []
+    for spec in specs.split(','):
+        start, dash, end = spec.strip().partition('-')
+        try:
+            if not dash:
+                raise ValueError(spec)
+            if start:
+                offset = int(start)
+                endByte = int(end) + 1 if end else size
+                if end and endByte <= offset:
+                    raise ValueError(spec)
+            else:
+                # A suffix range selects the last bytes of the entry
+                suffix = int(end)
+                offset, endByte = max(size - suffix, 0), size if suffix else 0
+        except ValueError:
+            return 200, 0, size
+        if offset < size and offset < endByte:
+            satisfiable.append((offset, min(endByte, size)))
+    if not satisfiable:
+        return 416, 0, 0
+    offset, endByte = satisfiable[0]
+    return 206, offset, endByte
@@ -0,0 +1,133 @@
+"""
+Size-bounded LRU cache of source media on a worker's local disk.
+Entries are addressed by Girder file id and checksum, and are hard linked
+into each job's working directory instead of being downloaded again.
+Downloads are only cached once their content matches the checksum.
+"""
+import contextlib
+import fcntl
+import hashlib
+import os
+from pathlib import Path
+import shutil
+import tempfile
+from typing import Callable, Iterator, Optional, Union
+
+from dive_utils.export_cache import PartialSuffix
+
+LockName = '.lock'
+ReadChunkSize = 1024 * 1024
+
+
+class IncompleteDownload(IOError):
+    """A download did not deliver the expected content"""
+
+
+def file_sha512(path: Union[str, Path]) -> str:
+    digest = hashlib.sha512()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(ReadChunkSize), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaCache:
+    def __init__(self, root: Union[str, Path], max_size: int):
+        self.root = Path(root)
+        self.max_size = max_size
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def make_key(fileId: str, sha512: Optional[str]) -> Optional[str]:
+        """Files without a checksum cannot be verified, so they are never cached"""
+        if not sha512:
+            return None
+        return f'{fileId}_{sha512}'
+
+    @contextlib.contextmanager
+    def _lock(self) -> Iterator[None]:
+        """Serialize changes to the cache across jobs and worker processes"""
+        with open(self.root / LockName, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _link(self, path: Path, dest: Path) -> bool:
+        """Place an entry at dest and mark it recently used, if it exists"""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        if dest.exists():
+            dest.unlink()
+        try:
+            os.link(path, dest)
+        except OSError:
+            # dest is on another filesystem, or it does not support hard links
+            shutil.copyfile(path, dest)
+        return True
+
+    def fetch(
+        self,
+        fileId: str,
+        sha512: Optional[str],
+        size: int,
+        dest: Path,
+        download: Callable[[Path], None],
+    ):
+        """
+        Place a file at dest from the cache, calling download(path) to fill it on a miss.
+        Files that cannot be cached are downloaded straight to dest.
+        A download whose size or checksum does not match is never cached.
+        """
+        key = self.make_key(fileId, sha512)
+        if not self.enabled or key is None or size > self.max_size:
+            download(dest)
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / key
+        with self._lock():
+            if self._link(path, dest):
+                return
+        # Download outside of the lock so that other jobs are not blocked
+        fd, partial = tempfile.mkstemp(dir=self.root, suffix=PartialSuffix)
+        os.close(fd)
+        try:
+            download(Path(partial))
+            actual = os.path.getsize(partial)
+            if actual != size:
+                raise IncompleteDownload(
+                    f'Downloaded {actual} bytes of {dest.name}, expected {size}'
+                )
+            if file_sha512(partial) != sha512:
+                raise IncompleteDownload(f'Downloaded {dest.name} does not match its checksum')
+            with self._lock():
+                os.replace(partial, path)
+                self._link(path, dest)
+                self.evict()
+        finally:
+            if os.path.exists(partial):
+                os.unlink(partial)
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits in max_size.
+        Entries still linked into a job's working directory are kept.
+        Must be called with the lock held.
+        """
+        entries = []
+        for path in self.root.iterdir():
+            if path.name == LockName or path.suffix == PartialSuffix:
+                continue
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, stat.st_nlink, path))
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, links, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            if links > 1:
+                continue
+            path.unlink()
+            total -= size
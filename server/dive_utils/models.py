@@ -1,4 +1,5 @@
-from typing import Any, Dict, List, Optional, Tuple, Union
+import datetime
+from typing import Any, Dict, Generator, Iterable, List, Optional, Tuple, TypeVar, Union
 
 from pydantic import BaseModel, Field, validator
 from typing_extensions import Literal
@@ -70,10 +71,153 @@ class Track(BaseModel):
             ]
         )
 
+    def feature_at(self, frame: int) -> Optional[Feature]:
+        """The keyframe or interpolated detection on frame, if the track has one"""
+        return feature_at_frame(self.features, frame)
+
+    def __hash__(self):
+        return self.trackId
+
+
+class FeatureRecord:
+    """
+    Lightweight, unvalidated counterpart to Feature for bulk processing.
+
+    Values are referenced from the source dict rather than copied,
+    so only use this on data that has already been validated.
+    """
+
+    __slots__ = (
+        'frame',
+        'flick',
+        'bounds',
+        'attributes',
+        'geometry',
+        'head',
+        'tail',
+        'fishLength',
+        'interpolate',
+        'keyframe',
+    )
+
+    def __init__(
+        self,
+        frame: int,
+        bounds: List[int],
+        flick: Optional[int] = None,
+        attributes: Optional[Dict[str, Union[bool, float, str]]] = None,
+        geometry: Optional[Dict[str, Any]] = None,
+        head: Optional[Tuple[float, float]] = None,
+        tail: Optional[Tuple[float, float]] = None,
+        fishLength: Optional[float] = None,
+        interpolate: Optional[bool] = False,
+        keyframe: Optional[bool] = True,
+    ):
+        self.frame = frame
+        self.flick = flick
+        self.bounds = bounds
+        self.attributes = attributes
+        self.geometry = geometry
+        self.head = head
+        self.tail = tail
+        self.fishLength = fishLength
+        self.interpolate = interpolate
+        self.keyframe = keyframe
+
+    @classmethod
+    def from_dict(cls, feature: Dict[str, Any]) -> 'FeatureRecord':
+        return cls(
+            frame=feature['frame'],
+            bounds=feature['bounds'],
+            flick=feature.get('flick'),
+            attributes=feature.get('attributes'),
+            geometry=feature.get('geometry'),
+            head=feature.get('head'),
+            tail=feature.get('tail'),
+            fishLength=feature.get('fishLength'),
+            interpolate=feature.get('interpolate', False),
+            keyframe=feature.get('keyframe', True),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Equivalent to Feature.dict(exclude_none=True)"""
+        values = ((name, getattr(self, name)) for name in self.__slots__)
+        return {name: value for name, value in values if value is not None}
+
+
+class TrackRecord:
+    """Lightweight, unvalidated counterpart to Track for bulk processing."""
+
+    __slots__ = ('begin', 'end', 'trackId', 'features', 'confidencePairs', 'attributes')
+
+    def __init__(
+        self,
+        begin: int,
+        end: int,
+        trackId: int,
+        features: Optional[List[FeatureRecord]] = None,
+        confidencePairs: Optional[List[Tuple[str, float]]] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.begin = begin
+        self.end = end
+        self.trackId = trackId
+        self.features = features if features is not None else []
+        self.confidencePairs = confidencePairs if confidencePairs is not None else []
+        self.attributes = attributes if attributes is not None else {}
+
+    @classmethod
+    def from_dict(cls, track: Dict[str, Any]) -> 'TrackRecord':
+        return cls(
+            begin=track['begin'],
+            end=track['end'],
+            trackId=track['trackId'],
+            features=[FeatureRecord.from_dict(f) for f in track.get('features', [])],
+            confidencePairs=track.get('confidencePairs'),
+            attributes=track.get('attributes'),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Equivalent to Track.dict(exclude_none=True)"""
+        return {
+            'begin': self.begin,
+            'end': self.end,
+            'trackId': self.trackId,
+            'features': [f.to_dict() for f in self.features],
+            'confidencePairs': self.confidencePairs,
+            'attributes': self.attributes,
+        }
+
+    def exceeds_thresholds(self, thresholds: Dict[str, float]) -> bool:
+        defaultThresh = thresholds.get('default', 0)
+        return any(
+            confidence >= thresholds.get(field, defaultThresh)
+            for field, confidence in self.confidencePairs
+        )
+
+    def feature_at(self, frame: int) -> Optional[FeatureRecord]:
+        """The keyframe or interpolated detection on frame, if the track has one"""
+        return feature_at_frame(self.features, frame)
+
     def __hash__(self):
         return self.trackId
 
 
+def load_track_records(
+    track_dict: Dict[Any, dict], trusted=False
+) -> Generator[TrackRecord, None, None]:
+    """
+    Lazily convert DIVE json into TrackRecords.
+
+    :param trusted: skip validation for data that was validated when it was saved.
+        Untrusted data is validated and normalized through Track first.
+    """
+    for t in track_dict.values():
+        if not trusted:
+            t = Track(**t).dict(exclude_none=True)
+        yield TrackRecord.from_dict(t)
+
+
 class Attribute(BaseModel):
     belongs: Literal['track', 'detection']
     datatype: Literal['text', 'number', 'boolean']
@@ -109,8 +253,112 @@ class SummaryItemSchema(BaseModel):
     found_in: List[str]
 
 
+class ImageManifestItemSchema(BaseModel):
+    """One frame of an image sequence, in natural sort order of item names"""
+
+    folderId: str
+    # The manifest build this frame belongs to
+    build: str
+    frame: int
+    itemId: str
+    name: str
+    size: int
+    fileId: Optional[str]
+    sha512: Optional[str]
+
+
+class LeavingItemSchema(BaseModel):
+    itemId: str
+    at: datetime.datetime
+
+
+class ImageManifestSchema(BaseModel):
+    """Which build of a media folder's image manifest is current"""
+
+    folderId: str
+    # Incremented after every change to the folder's web-safe images
+    version: int = 0
+    # A complete build of the manifest, current while builtVersion equals version
+    build: Optional[str]
+    builtVersion: Optional[int]
+    # Images being removed from the folder, which builds must not rely on until they are gone
+    leaving: List[LeavingItemSchema] = []
+
+
+class DatasetSummaryContribution(BaseModel):
+    """The summary items of a single published dataset, found only in that dataset"""
+
+    folderId: str
+    # Replaced on every write, so that writers can detect concurrent changes
+    version: Optional[str]
+    label_summary_items: List[SummaryItemSchema]
+
+
+class TypeStats(BaseModel):
+    value: str
+    total_tracks: int
+    total_detections: int
+    # Counts of this type's confidence values in equal-width bins over [0, 1]
+    confidence_histogram: List[int]
+
+
+class AttributeValueCount(BaseModel):
+    value: str
+    count: int
+
+
+class AttributeStats(BaseModel):
+    key: str
+    belongs: Literal['track', 'detection']
+    distinct_values: int
+    # The most common values, most common first
+    values: List[AttributeValueCount]
+
+
+class MaxNCount(BaseModel):
+    """The earliest frame with the most detections of a type"""
+
+    value: str
+    frame: int
+    count: int
+
+
+class DatasetStatsSchema(BaseModel):
+    """Compact statistics of one revision of a dataset's tracks"""
+
+    folderId: str
+    revision: Optional[str]  # detection item id, or None when there are no tracks
+    total_tracks: int
+    total_detections: int
+    begin: Optional[int]
+    end: Optional[int]
+    annotated_frames: int  # distinct frames with at least one detection
+    types: List[TypeStats]
+    attributes: List[AttributeStats]
+    # Missing from stats stored before MaxN was part of them
+    max_n: Optional[List[MaxNCount]]
+
+
+class TypeTimeline(BaseModel):
+    value: str
+    counts: List[int]
+
+
+class OccupancyTimeline(BaseModel):
+    """
+    Detections by type on each bucket of bucket_size frames, starting at begin.
+    The count of a bucket is the most detections on any one of its frames.
+    """
+
+    begin: Optional[int]
+    end: Optional[int]
+    bucket_size: int
+    types: List[TypeTimeline]
+
+
 class PublicDataSummary(BaseModel):
     label_summary_items: List[SummaryItemSchema]
+    contributions: List[DatasetSummaryContribution] = []
 
 
 class PrivateQueueEnabledResponse(BaseModel):
@@ -125,20 +373,61 @@ class CocoMetadata(BaseModel):
     videos: Dict[int, dict]
 
 
+AnyFeature = TypeVar('AnyFeature', Feature, FeatureRecord)
+AnyTrack = Union[Track, TrackRecord]
+
+
+def _interpolate_bounds(a: AnyFeature, b: AnyFeature, frame: int) -> List[int]:
+    delta = (frame - a.frame) / (b.frame - a.frame)
+    inverse_delta = 1 - delta
+    return [
+        round((abox * inverse_delta) + (bbox * delta)) for (abox, bbox) in zip(a.bounds, b.bounds)
+    ]
+
+
 # interpolate all features [a, b)
-def interpolate(a: Feature, b: Feature) -> List[Feature]:
+def interpolate(a: AnyFeature, b: AnyFeature) -> List[AnyFeature]:
     if a.interpolate is False:
         raise ValueError('Cannot interpolate feature without interpolate enabled')
     if b.frame <= a.frame:
         raise ValueError('b.frame must be larger than a.frame')
     feature_list = [a]
-    frame_range = b.frame - a.frame
-    for frame in range(1, frame_range):
-        delta = frame / frame_range
-        inverse_delta = 1 - delta
-        bounds: List[float] = [
-            round((abox * inverse_delta) + (bbox * delta))
-            for (abox, bbox) in zip(a.bounds, b.bounds)
-        ]
-        feature_list.append(Feature(frame=a.frame + frame, bounds=bounds, keyframe=False))
+    for frame in range(a.frame + 1, b.frame):
+        bounds = _interpolate_bounds(a, b, frame)
+        feature_list.append(type(a)(frame=frame, bounds=bounds, keyframe=False))
     return feature_list
+
+
+def feature_at_frame(features: List[AnyFeature], frame: int) -> Optional[AnyFeature]:
+    """
+    Binary search features, which must be sorted by frame, for the detection on frame.
+    Between keyframes, the result follows the same rules as interpolate().
+    """
+    lo, hi = 0, len(features)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if frame < features[mid].frame:
+            hi = mid
+        else:
+            lo = mid + 1
+    # lo is now the index of the first feature after frame
+    if lo == 0:
+        return None
+    keyframe = features[lo - 1]
+    if keyframe.frame == frame:
+        return keyframe
+    if keyframe.interpolate and lo < len(features):
+        bounds = _interpolate_bounds(keyframe, features[lo], frame)
+        return type(keyframe)(frame=frame, bounds=bounds, keyframe=False)
+    return None
+
+
+def features_at_frame(tracks: Iterable[AnyTrack], frame: int) -> Dict[int, Any]:
+    """Map trackId to the detection on frame for every track that has one"""
+    found: Dict[int, Any] = {}
+    for track in tracks:
+        if track.begin <= frame <= track.end:
+            feature = track.feature_at(frame)
+            if feature is not None:
+                found[track.trackId] = feature
+    return found
@@ -5,7 +5,7 @@ import functools
 from typing import Any, Dict, List, Tuple
 
 from dive_utils import strNumericCompare
-from dive_utils.models import CocoMetadata, Feature, Track
+from dive_utils.models import CocoMetadata, FeatureRecord, TrackRecord
 
 from . import viame
 
@@ -27,10 +27,9 @@ def annotation_info(annotation: dict, meta: CocoMetadata) -> Tuple[int, str, int
     # handle int and string types, throw error on UUID
     trackId = int(annotation.get('track_id', annotation_id))
 
-    bounds = annotation['bbox']
+    x, y, width, height = annotation['bbox']
     # update from [TL_x, TL_y, width, height] to [TL_x, TL_y, BR_x, BR_y]
-    bounds[2] += bounds[0]
-    bounds[3] += bounds[1]
+    bounds = [int(x), int(y), int(x + width), int(y + height)]
 
     return trackId, filename, frame, bounds
 
@@ -119,7 +118,7 @@ def _parse_annotation(annotation: dict, meta: CocoMetadata) -> Tuple[dict, dict,
 
 def _parse_annotation_for_tracks(
     annotation: dict, meta: CocoMetadata
-) -> Tuple[Feature, dict, dict, list]:
+) -> Tuple[FeatureRecord, dict, dict, list]:
     (
         features,
         attributes,
@@ -128,7 +127,7 @@ def _parse_annotation_for_tracks(
     ) = _parse_annotation(annotation, meta)
     trackId, filename, frame, bounds = annotation_info(annotation, meta)
 
-    feature = Feature(
+    feature = FeatureRecord(
         frame=frame,
         bounds=bounds,
         attributes=attributes or None,
@@ -187,7 +186,7 @@ def load_coco_as_tracks_and_attributes(coco: Dict[str, List[dict]]) -> Tuple[dic
     """
     Convert KWCOCO json to DIVE json tracks.
     """
-    tracks: Dict[int, Track] = {}
+    tracks: Dict[int, TrackRecord] = {}
     metadata_attributes: Dict[str, Dict[str, Any]] = {}
     test_vals: Dict[str, Dict[str, int]] = {}
     meta = load_coco_metadata(coco)
@@ -204,7 +203,7 @@ def load_coco_as_tracks_and_attributes(coco: Dict[str, List[dict]]) -> Tuple[dic
         trackId, _, frame, _ = annotation_info(annotation, meta)
 
         if trackId not in tracks:
-            tracks[trackId] = Track(begin=frame, end=frame, trackId=trackId)
+            tracks[trackId] = TrackRecord(begin=frame, end=frame, trackId=trackId)
 
         track = tracks[trackId]
         track.begin = min(frame, track.begin)
@@ -221,5 +220,5 @@ def load_coco_as_tracks_and_attributes(coco: Dict[str, List[dict]]) -> Tuple[dic
     # Now we process all the metadata_attributes for the types
     viame.calculate_attribute_types(metadata_attributes, test_vals)
 
-    track_json = {trackId: track.dict(exclude_none=True) for trackId, track in tracks.items()}
+    track_json = {trackId: track.to_dict() for trackId, track in tracks.items()}
     return track_json, metadata_attributes
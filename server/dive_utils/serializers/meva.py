@@ -1,11 +1,14 @@
 from dataclasses import dataclass, field
-from typing import ByteString, Dict, Iterable, List, Optional
+from typing import Any, ByteString, Dict, Generator, Iterable, List, Optional, Tuple
 
 from boiler import BoilerError, models
 from boiler.definitions import ActorType
 from boiler.serialization import kpf
 
-from dive_utils.models import Feature, Track
+from dive_utils.models import FeatureRecord, TrackRecord, interpolate, load_track_records
+
+# File suffixes of the yaml documents that make up a KPF annotation set
+KPF_SUFFIXES = (kpf.GEOM, kpf.TYPES, 'activities')
 
 
 @dataclass
@@ -71,13 +74,17 @@ def load_kpf_as_tracks(readers: List[Iterable[ByteString]]):
             print("WARNING: activity yaml was not given")
 
         tracks = parse_actor_map_to_tracks(actor_map)
-        return {trackId: track.dict(exclude_none=True) for trackId, track in tracks.items()}
+        # Validate through Track, as records built here have not been checked yet
+        records = load_track_records(
+            {trackId: track.to_dict() for trackId, track in tracks.items()}, trusted=False
+        )
+        return {record.trackId: record.to_dict() for record in records}
     except Exception as e:
         error_report['error'] = str(e)
         return error_report
 
 
-def parse_actor_map_to_tracks(actor_map: Dict[int, Actor]) -> Dict[int, Track]:
+def parse_actor_map_to_tracks(actor_map: Dict[int, Actor]) -> Dict[int, TrackRecord]:
     tracks = {}
     ids = {}
     i = 1
@@ -85,21 +92,29 @@ def parse_actor_map_to_tracks(actor_map: Dict[int, Actor]) -> Dict[int, Track]:
         actor = actor_map[actor_id]
         for detection in actor.detections:
             bounds = [
-                float(detection.box.left),
-                float(detection.box.bottom),
-                float(detection.box.right),
-                float(detection.box.top),
+                int(detection.box.left),
+                int(detection.box.top),
+                int(detection.box.right),
+                int(detection.box.bottom),
             ]
             feat_attributes = {
-                'timestamp': detection.timestamp,
-                'geom_id': detection.geom_id,
+                key: value
+                for key, value in (
+                    ('timestamp', detection.timestamp),
+                    ('geom_id', detection.geom_id),
+                )
+                if value is not None
             }
-            feature = Feature(frame=detection.frame, bounds=bounds, attributes=feat_attributes)
+            feature = FeatureRecord(
+                frame=detection.frame, bounds=bounds, attributes=feat_attributes
+            )
 
             # Create a new track per actor id
             if actor_id not in ids:
                 ids[actor_id] = i
-                confidence_pairs = [(actor.actor_type, actor.confidence)]
+                # Actors without a types packet have no confidence
+                confidence = 1.0 if actor.confidence is None else actor.confidence
+                confidence_pairs = [[actor.actor_type, confidence]]
                 track_attributes = {
                     'actor_id': actor_id,
                     'activity_id': actor.activity_id,
@@ -107,9 +122,11 @@ def parse_actor_map_to_tracks(actor_map: Dict[int, Actor]) -> Dict[int, Track]:
                     'confidence': actor.activity_con,
                     'status': actor.src_status,
                 }
-                tracks[i] = Track(
-                    begin=actor.begin,
-                    end=actor.end,
+                # Actors created from types or activities may not span their detections
+                frames = [d.frame for d in actor.detections]
+                tracks[i] = TrackRecord(
+                    begin=min(frames),
+                    end=max(frames),
                     trackId=i,
                     confidencePairs=confidence_pairs,
                     attributes=track_attributes,
@@ -150,7 +167,7 @@ def deserialize_geom(file, actor_map: Dict[int, Actor]):
             geom = geom_packet[kpf.GEOM]
             actor_id = geom[kpf.ACTOR_ID]
             frame = geom[kpf.FRAME]
-            timestamp = geom[kpf.SECONDS]
+            timestamp = geom.get(kpf.SECONDS)
             geom_id = geom[kpf.GEOM_ID]
             box = geom[kpf.BOX]
             box = [int(n) for n in box.split(' ')]
@@ -260,3 +277,125 @@ def _deserialize_actor(
             confidence=confidence,
         )
     return actor_map[actor_id]
+
+
+def _track_type(track: TrackRecord) -> Tuple[str, float]:
+    """Highest confidence pair for a track, which becomes its KPF actor type"""
+    if len(track.confidencePairs) == 0:
+        return ('other', 1.0)
+    return sorted(track.confidencePairs, key=lambda item: item[1], reverse=True)[0]
+
+
+def _yaml_list(lines: Iterable[str]) -> Generator[str, None, None]:
+    """Yield lines of a yaml list, or an explicit empty list so that it still loads as one"""
+    empty = True
+    for line in lines:
+        empty = False
+        yield line
+    if empty:
+        yield '[]\n'
+
+
+def serialize_types(track_dict: Dict[str, dict], trusted=False) -> Generator[str, None, None]:
+    """Yield one KPF types packet per track"""
+    for track in load_track_records(track_dict, trusted):
+        name, confidence = _track_type(track)
+        line = {kpf.TYPES: {kpf.ACTOR_ID: track.trackId, kpf.CSET3: {name: confidence}}}
+        yield kpf.dump_yaml_line(line)
+
+
+def serialize_geom(
+    track_dict: Dict[str, dict], fps: Optional[float] = None, trusted=False
+) -> Generator[str, None, None]:
+    """
+    Yield one KPF geom packet per detection, expanding interpolated spans.
+
+    :param fps: if set, ts1 will be derived from (frame / fps), otherwise it is
+        taken from the feature's timestamp attribute if one was imported, or omitted
+    """
+    geom_id = 1
+    for track in load_track_records(track_dict, trusted):
+        for index, keyframe in enumerate(track.features):
+            features = [keyframe]
+            if keyframe.interpolate and index < len(track.features) - 1:
+                features = interpolate(keyframe, track.features[index + 1])
+            for feature in features:
+                left, top, right, bottom = feature.bounds
+                geom: Dict[str, Any] = {
+                    kpf.ACTOR_ID: track.trackId,
+                    kpf.GEOM_ID: geom_id,
+                    kpf.FRAME: feature.frame,
+                    kpf.BOX: f'{left} {top} {right} {bottom}',
+                    kpf.KEYFRAME: bool(feature.keyframe),
+                }
+                if fps:
+                    geom[kpf.SECONDS] = feature.frame / fps
+                elif feature.attributes and feature.attributes.get('timestamp') is not None:
+                    geom[kpf.SECONDS] = feature.attributes['timestamp']
+                geom_id += 1
+                yield kpf.dump_yaml_line({kpf.GEOM: geom})
+
+
+def serialize_activities(track_dict: Dict[str, dict], trusted=False) -> Generator[str, None, None]:
+    """
+    Yield one KPF activity packet per activity_id found in track attributes.
+
+    Only the activity bookkeeping is held in memory; tracks without an
+    activity are written to geom and types only.
+    """
+    activities: Dict[int, Dict[str, Any]] = {}
+    for track in load_track_records(track_dict, trusted):
+        activity_id = track.attributes.get('activity_id')
+        activity_type = track.attributes.get('activity')
+        if activity_id is None or activity_type is None:
+            continue
+        activity = activities.setdefault(
+            activity_id,
+            {
+                'type': activity_type,
+                'confidence': track.attributes.get('confidence') or 1.0,
+                'status': track.attributes.get('status'),
+                'begin': track.begin,
+                'end': track.end,
+                'actors': [],
+            },
+        )
+        activity['begin'] = min(activity['begin'], track.begin)
+        activity['end'] = max(activity['end'], track.end)
+        activity['actors'].append(
+            {
+                kpf.ACTOR_ID: track.trackId,
+                kpf.TIMESPANS: [{kpf.FRAME_TIMESPAN: [track.begin, track.end]}],
+            }
+        )
+
+    for activity_id, activity in activities.items():
+        packet: Dict[str, Any] = {
+            kpf.ACTIVITY_TYPE: {activity['type']: activity['confidence']},
+            kpf.ACTIVITY_ID: activity_id,
+            kpf.TIMESPANS: [{kpf.FRAME_TIMESPAN: [activity['begin'], activity['end']]}],
+            kpf.ACTORS: activity['actors'],
+        }
+        if activity['status'] is not None:
+            packet[kpf.STATUS] = activity['status']
+        yield kpf.dump_yaml_line({kpf.ACTIVITY: packet})
+
+
+def export_tracks_as_kpf(
+    track_dict: Dict[str, dict], fps: Optional[float] = None, trusted=False
+) -> Dict[str, Generator[str, None, None]]:
+    """
+    Export track json to the three MEVA KPF yaml documents.
+
+    Each document is a lazy generator of lines, so callers can stream them
+    to disk or into an archive one at a time.
+
+    :param trusted: skip validation of track_dict, see models.load_track_records
+    :returns: map of file suffix (geom, types, activities) to line generator
+    """
+    geom, types, activities = KPF_SUFFIXES
+    return {
+        geom: _yaml_list(serialize_geom(track_dict, fps=fps, trusted=trusted)),
+        types: _yaml_list(serialize_types(track_dict, trusted=trusted)),
+        activities: _yaml_list(serialize_activities(track_dict, trusted=trusted)),
+    }
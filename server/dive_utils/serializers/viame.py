@@ -4,11 +4,13 @@ VIAME Fish format deserializer
 import csv
 import datetime
 import io
+import itertools
 import json
 import re
-from typing import Any, Dict, Generator, List, Tuple, Union
+from typing import Any, Dict, Generator, Iterable, List, Tuple, Union
 
-from dive_utils.models import Feature, Track, interpolate
+from dive_utils.models import FeatureRecord, TrackRecord, interpolate, load_track_records
+from dive_utils.thresholds import exceeds_thresholds, load_confidence_arrays
 
 
 def format_timestamp(fps: int, frame: int) -> str:
@@ -72,8 +74,16 @@ def _deduceType(value: str) -> Union[bool, float, str]:
         return value
 
 
+def _floatCoordinates(coords: Any) -> Any:
+    """Normalize nested coordinate sequences to lists of floats, as GeoJSONGeometry would"""
+    if isinstance(coords, (int, float)):
+        return float(coords)
+    return [_floatCoordinates(c) for c in coords]
+
+
 def create_geoJSONFeature(features: Dict[str, Any], type: str, coords: List[Any], key=''):
     feature = {}
+    coords = _floatCoordinates(coords)
     if "geometry" not in features:
         features["geometry"] = {"type": "FeatureCollection", "features": []}
     else:  # check for existing type/key pairs
@@ -164,11 +174,11 @@ def _parse_row(row: List[str]) -> Tuple[Dict, Dict, Dict, List]:
     return features, attributes, track_attributes, sorted_confidence_pairs
 
 
-def _parse_row_for_tracks(row: List[str]) -> Tuple[Feature, Dict, Dict, List]:
+def _parse_row_for_tracks(row: List[str]) -> Tuple[FeatureRecord, Dict, Dict, List]:
     head_tail_feature, attributes, track_attributes, confidence_pairs = _parse_row(row)
     trackId, filename, frame, bounds, fishLength = row_info(row)
 
-    feature = Feature(
+    feature = FeatureRecord(
         frame=frame,
         bounds=bounds,
         attributes=attributes or None,
@@ -239,7 +249,7 @@ def load_csv_as_tracks_and_attributes(rows: List[str]) -> Tuple[dict, dict]:
     Expect detections to be in increasing order (either globally or by track).
     """
     reader = csv.reader(row for row in rows if (not row.startswith("#") and row))
-    tracks: Dict[int, Track] = {}
+    tracks: Dict[int, TrackRecord] = {}
     metadata_attributes: Dict[str, Dict[str, Any]] = {}
     test_vals: Dict[str, Dict[str, int]] = {}
     for row in reader:
@@ -253,7 +263,7 @@ def load_csv_as_tracks_and_attributes(rows: List[str]) -> Tuple[dict, dict]:
         trackId, _, frame, _, _ = row_info(row)
 
         if trackId not in tracks:
-            tracks[trackId] = Track(begin=frame, end=frame, trackId=trackId)
+            tracks[trackId] = TrackRecord(begin=frame, end=frame, trackId=trackId)
 
         track = tracks[trackId]
         track.begin = min(frame, track.begin)
@@ -269,7 +279,7 @@ def load_csv_as_tracks_and_attributes(rows: List[str]) -> Tuple[dict, dict]:
     # Now we process all the metadata_attributes for the types
     calculate_attribute_types(metadata_attributes, test_vals)
 
-    track_json = {trackId: track.dict(exclude_none=True) for trackId, track in tracks.items()}
+    track_json = {trackId: track.to_dict() for trackId, track in tracks.items()}
     return track_json, metadata_attributes
 
 
@@ -281,6 +291,7 @@ def export_tracks_as_csv(
     fps=None,
     header=True,
     typeFilter=None,
+    trusted=False,
 ) -> Generator[str, None, None]:
     """
     Export track json to a CSV format.
@@ -296,6 +307,8 @@ def export_tracks_as_csv(
     :param header: include or omit header
 
     :param typeFilter: set of track types to only export if not empty
+
+    :param trusted: skip validation of track_dict, see models.load_track_records
     """
     if thresholds is None:
         thresholds = {}
@@ -310,10 +323,11 @@ def export_tracks_as_csv(
             metadata["fps"] = fps
         writeHeader(writer, metadata)
     track_values = track_dict.values()
-    for t in track_values:
-        track = Track(**t)
-        if (not excludeBelowThreshold) or track.exceeds_thresholds(thresholds):
-
+    included: Iterable[bool] = itertools.repeat(True)
+    if excludeBelowThreshold:
+        included = exceeds_thresholds(load_confidence_arrays(track_values), thresholds)
+    for track, include in zip(load_track_records(track_dict, trusted), included):
+        if include:
             # filter by types if applicable
             if typeFilter:
                 confidence_pairs = [item for item in track.confidencePairs if item[0] in typeFilter]
@@ -365,24 +379,23 @@ def export_tracks_as_csv(
                         for key, val in track.attributes.items():
                             columns.append(f"(trk-atr) {key} {valueToString(val)}")
 
-                    if feature.geometry and "FeatureCollection" == feature.geometry.type:
-                        for geoJSONFeature in feature.geometry.features:
-                            if 'Polygon' == geoJSONFeature.geometry.type:
+                    if feature.geometry and "FeatureCollection" == feature.geometry['type']:
+                        for geoJSONFeature in feature.geometry['features']:
+                            geometry = geoJSONFeature['geometry']
+                            if 'Polygon' == geometry['type']:
                                 # Coordinates need to be flattened out from their list of tuples
                                 coordinates = [
                                     item
-                                    for sublist in geoJSONFeature.geometry.coordinates[
-                                        0
-                                    ]  # type: ignore
-                                    for item in sublist  # type: ignore
+                                    for sublist in geometry['coordinates'][0]
+                                    for item in sublist
                                 ]
                                 columns.append(
                                     f"(poly) {' '.join(map(lambda x: str(round(x)), coordinates))}"
                                 )
-                            if 'Point' == geoJSONFeature.geometry.type:
-                                coordinates = geoJSONFeature.geometry.coordinates  # type: ignore
+                            if 'Point' == geometry['type']:
+                                coordinates = geometry['coordinates']
                                 columns.append(
-                                    f"(kp) {geoJSONFeature.properties['key']} "
+                                    f"(kp) {geoJSONFeature['properties']['key']} "
                                     f"{round(coordinates[0])} {round(coordinates[1])}"
                                 )
                             # TODO: support for multiple GeoJSON Objects of the same type
@@ -394,3 +407,31 @@ def export_tracks_as_csv(
                     csvFile.truncate(0)
     if len(track_values) == 0:
         yield csvFile.getvalue()
+
+
+def merge_csv_chunks(chunks: Iterable[Tuple[int, Iterable[str]]]) -> Generator[str, None, None]:
+    """
+    Concatenate the CSV output of separate pipeline runs over consecutive chunks
+    of one image sequence.  Each chunk is (first frame, lines), with frames numbered
+    from 0 within the chunk.  Frames are shifted to match the whole sequence and
+    track ids are renumbered to stay unique, and only the first chunk's comments are kept.
+    """
+    csvFile = io.StringIO()
+    writer = csv.writer(csvFile)
+    trackOffset = 0
+    for index, (firstFrame, lines) in enumerate(chunks):
+        nextOffset = trackOffset
+        for row in csv.reader(lines):
+            if len(row) == 0 or row[0].startswith('#'):
+                if index == 0:
+                    writer.writerow(row)
+            else:
+                trackId = int(row[0]) + trackOffset
+                nextOffset = max(nextOffset, trackId + 1)
+                row[0] = str(trackId)
+                row[2] = str(int(row[2]) + firstFrame)
+                writer.writerow(row)
+            yield csvFile.getvalue()
+            csvFile.seek(0)
+            csvFile.truncate(0)
+        trackOffset = nextOffset
@@ -0,0 +1,201 @@
+"""
+Per-revision dataset statistics and MaxN counts.
+
+Stats are computed in one pass over the tracks when a revision is saved,
+so that dashboards can answer questions about a dataset without loading
+its track data.
+"""
+from collections import Counter, defaultdict
+import json
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from dive_utils import models
+
+ConfidenceHistogramBins = 10
+# Values kept per attribute; the rest are only reflected in distinct_values
+AttributeValueLimit = 50
+
+
+def confidence_bin(confidence: float) -> int:
+    """Equal-width histogram bin of a confidence in [0, 1], clamping outliers"""
+    return min(max(int(confidence * ConfidenceHistogramBins), 0), ConfidenceHistogramBins - 1)
+
+
+def attribute_value_key(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def compute_dataset_stats(
+    folderId: str, revision: Optional[str], trackData: Dict[str, Any], trusted=False
+) -> models.DatasetStatsSchema:
+    """
+    Summarize a revision of DIVE json.
+
+    Type counts follow summarize_annotations: a track counts once toward every
+    type in its confidencePairs, along with all of its detections.
+    MaxN follows max_n_summary.
+    """
+    total_tracks = 0
+    total_detections = 0
+    frames: Set[int] = set()
+    types: Dict[str, models.TypeStats] = {}
+    attributes: Dict[Tuple[str, str], Counter] = defaultdict(Counter)
+    intervals = OccupancyIntervals()
+
+    for track in models.load_track_records(trackData, trusted):
+        total_tracks += 1
+        total_detections += len(track.features)
+        intervals.add(track)
+        for name, confidence in track.confidencePairs:
+            if name not in types:
+                types[name] = models.TypeStats(
+                    value=name,
+                    total_tracks=0,
+                    total_detections=0,
+                    confidence_histogram=[0] * ConfidenceHistogramBins,
+                )
+            stats = types[name]
+            stats.total_tracks += 1
+            stats.total_detections += len(track.features)
+            stats.confidence_histogram[confidence_bin(confidence)] += 1
+        for key, value in track.attributes.items():
+            attributes[('track', key)][attribute_value_key(value)] += 1
+        for feature in track.features:
+            frames.add(feature.frame)
+            for key, value in (feature.attributes or {}).items():
+                attributes[('detection', key)][attribute_value_key(value)] += 1
+
+    return models.DatasetStatsSchema(
+        folderId=folderId,
+        revision=revision,
+        total_tracks=total_tracks,
+        total_detections=total_detections,
+        begin=min(frames) if frames else None,
+        end=max(frames) if frames else None,
+        annotated_frames=len(frames),
+        types=sorted(types.values(), key=lambda t: t.value),
+        attributes=[
+            models.AttributeStats(
+                key=key,
+                belongs=belongs,
+                distinct_values=len(counts),
+                values=[
+                    models.AttributeValueCount(value=value, count=count)
+                    for value, count in counts.most_common(AttributeValueLimit)
+                ],
+            )
+            for (belongs, key), counts in sorted(attributes.items())
+        ],
+        max_n=[
+            models.MaxNCount(value=value, **result)
+            for value, result in sorted(intervals.max_n().items())
+        ],
+    )
+
+
+def occupancy_intervals(features: List[models.AnyFeature]) -> Iterator[Tuple[int, int]]:
+    """
+    Inclusive frame ranges on which a track has a detection, in frame order.
+    Between keyframes, this follows the same rules as feature_at_frame().
+    """
+    start: Optional[int] = None
+    end = 0
+    for index, feature in enumerate(features):
+        last = feature.frame
+        if feature.interpolate and index < len(features) - 1:
+            last = max(features[index + 1].frame - 1, last)
+        if start is not None and feature.frame <= end + 1:
+            end = max(end, last)
+            continue
+        if start is not None:
+            yield start, end
+        start, end = feature.frame, last
+    if start is not None:
+        yield start, end
+
+
+class OccupancyIntervals:
+    """Occupancy intervals of tracks, grouped by the type of each track"""
+
+    def __init__(self):
+        self.starts: Dict[str, List[int]] = defaultdict(list)
+        self.stops: Dict[str, List[int]] = defaultdict(list)
+
+    def add(self, track: models.AnyTrack):
+        """Add a track's intervals under the type of its highest confidence pair"""
+        if track.confidencePairs:
+            trackType = max(track.confidencePairs, key=lambda pair: pair[1])[0]
+        else:
+            trackType = 'unknown'
+        for start, end in occupancy_intervals(track.features):
+            self.starts[trackType].append(start)
+            self.stops[trackType].append(end + 1)
+
+    def max_n(self) -> Dict[str, Dict[str, int]]:
+        """
+        Occupancy intervals become +1/-1 events, and one cumulative sum per type
+        over the events in frame order gives the count on every frame where it changes.
+        """
+        maxN: Dict[str, Dict[str, int]] = {}
+        for trackType, typeStarts in self.starts.items():
+            frames = np.array(typeStarts + self.stops[trackType], dtype=np.int64)
+            deltas = np.ones(len(frames), dtype=np.int64)
+            deltas[len(typeStarts) :] = -1
+            order = np.argsort(frames, kind='stable')
+            frames = frames[order]
+            counts = np.cumsum(deltas[order])
+            # The count on a frame is the running total after the last event on that frame
+            lastEvent = np.append(frames[1:] != frames[:-1], True)
+            frames = frames[lastEvent]
+            counts = counts[lastEvent]
+            peak = int(np.argmax(counts))
+            maxN[trackType] = {'frame': int(frames[peak]), 'count': int(counts[peak])}
+        return maxN
+
+    def timeline(self, bucketSize=1, maxBuckets: Optional[int] = None) -> models.OccupancyTimeline:
+        """
+        Difference arrays of the +1/-1 events, summed into per-frame counts of every type.
+        bucketSize is increased as needed to fit in maxBuckets, and reduced to at most
+        the length of the dataset, so memory is proportional to the frames spanned.
+        """
+        if not self.starts:
+            return models.OccupancyTimeline(begin=None, end=None, bucket_size=bucketSize, types=[])
+        begin = min(min(typeStarts) for typeStarts in self.starts.values())
+        end = max(max(typeStops) for typeStops in self.stops.values()) - 1
+        length = end - begin + 1
+        if maxBuckets:
+            bucketSize = max(bucketSize, -(-length // maxBuckets))
+        bucketSize = min(bucketSize, length)
+        bucketStarts = np.arange(0, length, bucketSize)
+        types = []
+        for trackType in sorted(self.starts):
+            starts = np.array(self.starts[trackType], dtype=np.int64) - begin
+            stops = np.array(self.stops[trackType], dtype=np.int64) - begin
+            deltas = np.bincount(starts, minlength=length + 1)
+            deltas -= np.bincount(stops, minlength=length + 1)
+            counts = np.maximum.reduceat(np.cumsum(deltas[:length]), bucketStarts)
+            types.append(models.TypeTimeline(value=trackType, counts=counts.tolist()))
+        return models.OccupancyTimeline(begin=begin, end=end, bucket_size=bucketSize, types=types)
+
+
+def max_n_summary(trackData: Dict[str, Any], trusted=False) -> Dict[str, Dict[str, int]]:
+    """
+    Map each track type to the earliest frame with the most detections of that type,
+    as {'frame', 'count'}.  A track's type is its highest confidence pair.
+    """
+    intervals = OccupancyIntervals()
+    for track in models.load_track_records(trackData, trusted):
+        intervals.add(track)
+    return intervals.max_n()
+
+
+def occupancy_timeline(
+    trackData: Dict[str, Any], trusted=False, bucketSize=1, maxBuckets: Optional[int] = None
+) -> models.OccupancyTimeline:
+    """Per-frame or per-bucket detection counts, by the same rules as max_n_summary"""
+    intervals = OccupancyIntervals()
+    for track in models.load_track_records(trackData, trusted):
+        intervals.add(track)
+    return intervals.timeline(bucketSize, maxBuckets)
@@ -0,0 +1,82 @@
+"""
+Streaming uncompressed tar archives of flat file lists.
+
+Archives are generated one member at a time, so a server can stream many
+small files in a single response, and extracted on the fly as they arrive.
+"""
+import os
+from pathlib import Path
+import tarfile
+from typing import BinaryIO, Iterable, Iterator, List, Union
+
+ReadChunkSize = 1024 * 1024
+
+
+class IncompleteArchive(tarfile.TarError):
+    """An archive stream ended early, or held other members than expected"""
+
+
+def tar_file(
+    name: str, size: int, chunks: Iterable[Union[str, bytes]], mtime: int = 0
+) -> Iterator[bytes]:
+    """Generate one archive member; chunks must add up to exactly size bytes"""
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = mtime
+    info.mode = 0o644
+    yield info.tobuf(format=tarfile.PAX_FORMAT)
+    written = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf8')
+        written += len(chunk)
+        yield chunk
+    if written != size:
+        raise ValueError(f'{name} was {written} bytes but its header says {size}')
+    yield b'\0' * (-size % tarfile.BLOCKSIZE)
+
+
+def tar_footer() -> bytes:
+    return b'\0' * (2 * tarfile.BLOCKSIZE)
+
+
+def extract_flat(fileobj: BinaryIO, dest: Path) -> Iterator[Path]:
+    """
+    Extract the regular files of a tar stream into dest, yielding each path as it is written.
+    Member directories are discarded, so a member can never be written outside of dest.
+    """
+    with tarfile.open(fileobj=fileobj, mode='r|') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            name = os.path.basename(member.name)
+            if name in ('', '.', '..'):
+                continue
+            source = archive.extractfile(member)
+            if source is None:
+                continue
+            path = dest / name
+            with source, open(path, 'wb') as target:
+                while True:
+                    data = source.read(ReadChunkSize)
+                    if not data:
+                        break
+                    target.write(data)
+            yield path
+
+
+def extract_expected(fileobj: BinaryIO, dest: Path, names: List[str]) -> Iterator[Path]:
+    """
+    Extract a tar stream with extract_flat, checking that its members are exactly names in order.
+    tarfile reads a stream cut off between two members as a complete archive,
+    so a short stream can only be detected by counting its members.
+    """
+    count = 0
+    for path in extract_flat(fileobj, dest):
+        if count >= len(names) or path.name != os.path.basename(names[count]):
+            expected = names[count] if count < len(names) else 'the end of the archive'
+            raise IncompleteArchive(f'Expected {expected} but found {path.name}')
+        count += 1
+        yield path
+    if count != len(names):
+        raise IncompleteArchive(f'Archive ended after {count} of {len(names)} members')
@@ -7,6 +7,7 @@ __all__ = [
     "PipelineDescription",
     "PipelineJob",
     "PipelineCategory",
+    "ExportJob",
 ]
 
 
@@ -57,6 +58,19 @@ class PipelineJob(TypedDict):
     pipeline_input: Optional[GirderModel]
 
 
+class ExportJob(TypedDict):
+    """Describes the parameters for assembling a dataset export archive."""
+
+    input_folder: str
+    # The folder holding the dataset's media, which differs from input_folder for clones
+    media_folder: str
+    output_folder: str
+    include_media: bool
+    include_detections: bool
+    exclude_below_threshold: bool
+    type_filter: List[str]
+
+
 class TrainingConfigurationSummary(TypedDict):
     configs: List[str]
     default: Optional[str]
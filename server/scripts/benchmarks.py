@@ -0,0 +1,100 @@
+"""
+Micro-benchmarks for the serialization hot paths.
+
+These run against synthetic in-memory data so that results are comparable
+between machines and branches.
+"""
+import gc
+import json
+import os
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Tuple
+
+from girder.utility import ziputil
+
+from dive_utils.models import Track, TrackRecord
+
+
+def make_track_dict(track_count: int, track_length: int) -> Dict[str, dict]:
+    """Build DIVE json for track_count tracks with track_length keyframes each"""
+    tracks = {}
+    for trackId in range(track_count):
+        tracks[str(trackId)] = {
+            "trackId": trackId,
+            "begin": 0,
+            "end": track_length - 1,
+            "confidencePairs": [[f"Type_{trackId % 10}", 0.5]],
+            "attributes": {},
+            "features": [
+                {
+                    "frame": frame,
+                    "bounds": [frame, frame, frame + 10, frame + 10],
+                    "keyframe": True,
+                    "interpolate": False,
+                }
+                for frame in range(track_length)
+            ],
+        }
+    return tracks
+
+
+def measure(fn: Callable[[], Any]) -> Tuple[float, int]:
+    """
+    Run fn once, returning elapsed seconds and bytes held by its result.
+    Memory is measured in a second run so that tracing does not skew timing.
+    """
+    gc.collect()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    del result
+
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    result = fn()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, current - baseline
+
+
+def benchmark_track_models(track_count: int, track_length: int) -> Dict[str, Tuple[float, int]]:
+    """Compare constructing validated Track models against TrackRecord views"""
+    track_dict = make_track_dict(track_count, track_length)
+    return {
+        'pydantic Track': measure(lambda: [Track(**t) for t in track_dict.values()]),
+        'TrackRecord': measure(lambda: [TrackRecord.from_dict(t) for t in track_dict.values()]),
+    }
+
+
+def benchmark_zip_compression(
+    media_count: int, media_size: int, track_count: int
+) -> Dict[str, Tuple[float, int]]:
+    """
+    Compare CPU seconds and archive bytes for export zips under different per-entry
+    compression choices. Random bytes stand in for already-compressed media.
+    """
+    media = [os.urandom(media_size) for _ in range(media_count)]
+    annotations = json.dumps(make_track_dict(track_count, 10)).encode()
+
+    def run(media_compression: int, annotation_compression: int) -> Tuple[float, int]:
+        z = ziputil.ZipGenerator('benchmark')
+        size = 0
+        start = time.process_time()
+        for index, data in enumerate(media):
+            z.compression = media_compression
+            for chunk in z.addFile(lambda data=data: iter([data]), f'{index:06d}.jpg'):
+                size += len(chunk)
+        z.compression = annotation_compression
+        for chunk in z.addFile(lambda: iter([annotations]), 'tracks.json'):
+            size += len(chunk)
+        size += len(z.footer())
+        return time.process_time() - start, size
+
+    return {
+        'deflate all': run(ziputil.DEFLATE, ziputil.DEFLATE),
+        'store all': run(ziputil.STORE, ziputil.STORE),
+        'store media': run(ziputil.STORE, ziputil.DEFLATE),
+    }
@@ -6,7 +6,7 @@ Debug cli needs [dev] extra_require from setuptools.
 """
 import click
 
-from scripts import cli, generateLargeDataset
+from scripts import benchmarks, cli, generateLargeDataset
 
 
 @cli.command(name="generate-data", help="Generate fake datasets for testing")
@@ -36,3 +36,29 @@ def generate_dataset(
         width,
         height,
     )
+
+
+@cli.command(name="benchmark-tracks", help="Compare track model construction time and memory")
+@click.option('--tracks', default=10000, help='Number of Tracks')
+@click.option('--track_length', default=100, help='Features per Track')
+def benchmark_tracks(tracks, track_length):
+    features = tracks * track_length
+    results = benchmarks.benchmark_track_models(tracks, track_length)
+    for name, (elapsed, allocated) in results.items():
+        click.echo(
+            f'{name:>16}: {elapsed:8.3f}s {allocated / 2 ** 20:10.1f} MiB'
+            f' {allocated / features:8.1f} B/feature'
+        )
+
+
+@cli.command(name="benchmark-zip", help="Compare export zip CPU time by compression mode")
+@click.option('--media', default=200, help='Number of media files')
+@click.option('--media_size', default=1024 * 1024, help='Bytes per media file')
+@click.option('--tracks', default=10000, help='Number of Tracks')
+def benchmark_zip(media, media_size, tracks):
+    results = benchmarks.benchmark_zip_compression(media, media_size, tracks)
+    for name, (elapsed, size) in results.items():
+        click.echo(
+            f'{name:>16}: {elapsed:8.3f}s cpu {size / 2 ** 20:10.1f} MiB'
+            f' {elapsed / (size / 2 ** 30):8.2f}s/GiB'
+        )
@@ -46,6 +46,24 @@ def convert_kpf(inputs: List[BinaryIO], output: TextIO):
     click.secho(f'wrote output {output.name}', fg='green')
 
 
+@convert.command(name="dive2kpf")
+@click.argument('input', type=click.File('rt'))
+@click.option(
+    '--output-basename',
+    type=click.Path(dir_okay=False),
+    default='result',
+    help="Write <basename>.geom.yml, <basename>.types.yml and <basename>.activities.yml",
+)
+@click.option('--fps', type=click.FloatRange(0), default=None, help="Annotation FPS")
+def convert_dive_kpf(input: TextIO, output_basename: str, fps: Optional[float]):
+    data = json.load(input)
+    for suffix, lines in meva.export_tracks_as_kpf(data, fps=fps).items():
+        path = f'{output_basename}.{suffix}.yml'
+        with open(path, 'w', encoding='utf-8') as output:
+            output.writelines(lines)
+        click.secho(f'wrote output {path}', fg='green')
+
+
 @convert.command(name="coco2dive")
 @click.argument('input', type=click.File('rt'))
 @click.option('--output', type=click.File('wt'), default='result.json')
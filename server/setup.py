@@ -11,6 +11,7 @@ requirements = [
     "girder_jobs==3.0.3",
     "girder_worker==0.8.1",
     "girder_worker_utils==0.8.5",
+    "numpy==1.21.6",  # Last release supporting python 3.7
     "pydantic==1.8.2",
     "pyrabbit2==1.0.7",  # For rabbitmq_user_queues plugin
     "typing_extensions",
@@ -21,7 +22,6 @@ requirements = [
 ]
 
 dev_requirements = [
-    "numpy",
     "opencv-python",
     "pytest",
     "tox",
@@ -0,0 +1,300 @@
+import random
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+from dive_utils import models, stats
+
+track_dict = {
+    "0": {
+        "trackId": 0,
+        "begin": 2,
+        "end": 4,
+        "confidencePairs": [["fish", 0.95], ["rock", 0.1]],
+        "attributes": {"species": "cod", "adult": True},
+        "features": [
+            {"frame": 2, "bounds": [0, 0, 1, 1], "attributes": {"visible": True}},
+            {"frame": 4, "bounds": [0, 0, 1, 1], "attributes": {"visible": False}},
+        ],
+    },
+    "1": {
+        "trackId": 1,
+        "begin": 4,
+        "end": 7,
+        "confidencePairs": [["fish", 0.5]],
+        "attributes": {"species": "cod"},
+        "features": [
+            {"frame": 4, "bounds": [0, 0, 1, 1], "attributes": {"visible": True}},
+            {"frame": 7, "bounds": [0, 0, 1, 1]},
+        ],
+    },
+    "2": {
+        "trackId": 2,
+        "begin": 9,
+        "end": 9,
+        "confidencePairs": [["crab", 1.0]],
+        "attributes": {"species": "spider crab"},
+        "features": [{"frame": 9, "bounds": [0, 0, 1, 1]}],
+    },
+    "3": {"trackId": 3, "begin": 0, "end": 0, "confidencePairs": [], "features": []},
+}
+
+test_tuple = [
+    (
+        {},
+        {
+            "total_tracks": 0,
+            "total_detections": 0,
+            "begin": None,
+            "end": None,
+            "annotated_frames": 0,
+            "types": [],
+            "attributes": [],
+            "max_n": [],
+        },
+    ),
+    (
+        track_dict,
+        {
+            "total_tracks": 4,
+            "total_detections": 5,
+            "begin": 2,
+            "end": 9,
+            "annotated_frames": 4,
+            "types": [
+                {
+                    "value": "crab",
+                    "total_tracks": 1,
+                    "total_detections": 1,
+                    "confidence_histogram": [0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+                },
+                {
+                    "value": "fish",
+                    "total_tracks": 2,
+                    "total_detections": 4,
+                    "confidence_histogram": [0, 0, 0, 0, 0, 1, 0, 0, 0, 1],
+                },
+                {
+                    "value": "rock",
+                    "total_tracks": 1,
+                    "total_detections": 2,
+                    "confidence_histogram": [0, 1, 0, 0, 0, 0, 0, 0, 0, 0],
+                },
+            ],
+            "attributes": [
+                {
+                    "key": "visible",
+                    "belongs": "detection",
+                    "distinct_values": 2,
+                    "values": [{"value": "true", "count": 2}, {"value": "false", "count": 1}],
+                },
+                {
+                    "key": "adult",
+                    "belongs": "track",
+                    "distinct_values": 1,
+                    "values": [{"value": "true", "count": 1}],
+                },
+                {
+                    "key": "species",
+                    "belongs": "track",
+                    "distinct_values": 2,
+                    "values": [
+                        {"value": "cod", "count": 2},
+                        {"value": "spider crab", "count": 1},
+                    ],
+                },
+            ],
+            "max_n": [
+                {"value": "crab", "frame": 9, "count": 1},
+                {"value": "fish", "frame": 4, "count": 2},
+            ],
+        },
+    ),
+]
+
+
+@pytest.mark.parametrize("input,expected", test_tuple)
+def test_compute_dataset_stats(input: Dict[str, dict], expected: Dict[str, Any]):
+    for trusted in [True, False]:
+        result = stats.compute_dataset_stats("folder", "revision", input, trusted=trusted)
+        assert result.dict() == {"folderId": "folder", "revision": "revision", **expected}
+
+
+def test_attribute_value_limit():
+    tracks = {
+        str(i): {
+            "trackId": i,
+            "begin": 0,
+            "end": 0,
+            "attributes": {"length": i % (stats.AttributeValueLimit + 5)},
+        }
+        for i in range(200)
+    }
+    result = stats.compute_dataset_stats("folder", None, tracks)
+    [attribute] = result.attributes
+    assert attribute.distinct_values == stats.AttributeValueLimit + 5
+    assert len(attribute.values) == stats.AttributeValueLimit
+    assert sum(v.count for v in attribute.values) <= 200
+
+
+def feature(frame: int, interpolate=False, keyframe=True):
+    return {
+        "frame": frame,
+        "bounds": [0, 0, 10, 10],
+        "interpolate": interpolate,
+        "keyframe": keyframe,
+    }
+
+
+def track(trackId: int, features: List[dict], confidencePairs: List[list]):
+    return {
+        "trackId": trackId,
+        "begin": features[0]["frame"] if features else 0,
+        "end": features[-1]["frame"] if features else 0,
+        "features": features,
+        "confidencePairs": confidencePairs,
+    }
+
+
+max_n_tuple: List[Tuple[List[dict], Dict[str, Dict[str, int]]]] = [
+    ([], {}),
+    (
+        # Sparse keyframes only occupy their own frames, so these never overlap
+        [
+            track(0, [feature(0), feature(10)], [["fish", 1]]),
+            track(1, [feature(5)], [["fish", 1]]),
+        ],
+        {"fish": {"frame": 0, "count": 1}},
+    ),
+    (
+        # Interpolated spans cover every frame up to the next keyframe
+        [
+            track(0, [feature(0, True), feature(10)], [["fish", 1]]),
+            track(1, [feature(9)], [["fish", 1]]),
+            track(2, [feature(8, True), feature(12, True), feature(20)], [["fish", 1]]),
+        ],
+        {"fish": {"frame": 9, "count": 3}},
+    ),
+    (
+        # A gap after an interpolated span ends the track's occupancy
+        [
+            track(0, [feature(0, True), feature(4), feature(30)], [["fish", 1]]),
+            track(1, [feature(10, True), feature(40)], [["fish", 1]]),
+            track(2, [feature(30)], [["fish", 1]]),
+        ],
+        {"fish": {"frame": 30, "count": 3}},
+    ),
+    (
+        # Tracks count toward their highest confidence type only
+        [
+            track(0, [feature(2, True), feature(6)], [["fish", 0.4], ["rock", 0.6]]),
+            track(1, [feature(3, True), feature(4)], [["rock", 0.9]]),
+            track(2, [feature(3)], [["fish", 0.9]]),
+            track(3, [feature(7)], []),
+            track(4, [], [["crab", 1]]),
+        ],
+        {
+            "rock": {"frame": 3, "count": 2},
+            "fish": {"frame": 3, "count": 1},
+            "unknown": {"frame": 7, "count": 1},
+        },
+    ),
+]
+
+
+def brute_force_max_n(tracks: List[dict]):
+    records = list(models.load_track_records({str(t["trackId"]): t for t in tracks}))
+    maxN: Dict[str, Dict[str, int]] = {}
+    for frame in range(max((t.end for t in records), default=-1) + 1):
+        counts: Dict[str, int] = {}
+        for record in records:
+            if models.feature_at_frame(record.features, frame) is not None:
+                name = max(record.confidencePairs, key=lambda p: p[1])[0]
+                counts[name] = counts.get(name, 0) + 1
+        for name, count in counts.items():
+            if count > maxN.get(name, {"count": 0})["count"]:
+                maxN[name] = {"frame": frame, "count": count}
+    return maxN
+
+
+@pytest.mark.parametrize("tracks,expected", max_n_tuple)
+def test_max_n_summary(tracks: List[dict], expected: Dict[str, Dict[str, int]]):
+    track_dict = {str(t["trackId"]): t for t in tracks}
+    assert stats.max_n_summary(track_dict) == expected
+    assert stats.max_n_summary(track_dict, trusted=True) == expected
+    typed = [t for t in tracks if t["confidencePairs"]]
+    assert brute_force_max_n(typed) == {k: v for k, v in expected.items() if k != "unknown"}
+
+
+def test_max_n_summary_random():
+    rng = random.Random(0)
+    tracks = []
+    for trackId in range(200):
+        frames = sorted(rng.sample(range(300), rng.randint(1, 8)))
+        tracks.append(
+            track(
+                trackId,
+                [feature(frame, rng.random() < 0.5) for frame in frames],
+                [[rng.choice(["fish", "rock", "crab"]), 1]],
+            )
+        )
+    track_dict = {str(t["trackId"]): t for t in tracks}
+    assert stats.max_n_summary(track_dict) == brute_force_max_n(tracks)
+
+
+def brute_force_timeline(tracks: List[dict], begin: int, end: int):
+    records = list(models.load_track_records({str(t["trackId"]): t for t in tracks}))
+    timeline: Dict[str, List[int]] = {}
+    for record in records:
+        name = max(record.confidencePairs, key=lambda p: p[1])[0]
+        timeline.setdefault(name, [0] * (end - begin + 1))
+    for frame in range(begin, end + 1):
+        for record in records:
+            if models.feature_at_frame(record.features, frame) is not None:
+                name = max(record.confidencePairs, key=lambda p: p[1])[0]
+                timeline[name][frame - begin] += 1
+    return timeline
+
+
+@pytest.mark.parametrize("tracks,expected", max_n_tuple)
+def test_occupancy_timeline(tracks: List[dict], expected: Dict[str, Dict[str, int]]):
+    typed = [t for t in tracks if t["features"] and t["confidencePairs"]]
+    timeline = stats.occupancy_timeline({str(t["trackId"]): t for t in typed})
+    assert timeline.bucket_size == 1
+    if not typed:
+        assert timeline.types == [] and timeline.begin is None
+        return
+    counts = {t.value: t.counts for t in timeline.types}
+    assert counts == brute_force_timeline(typed, timeline.begin, timeline.end)
+    for name, typeCounts in counts.items():
+        assert max(typeCounts) == expected[name]["count"]
+        assert typeCounts.index(max(typeCounts)) + timeline.begin == expected[name]["frame"]
+
+
+test_bucket_tuple = [
+    (1, None, 1, [1, 1, 2, 2, 2, 1, 1]),
+    (2, None, 2, [1, 2, 2, 1]),
+    (3, None, 3, [2, 2, 1]),
+    (1, 3, 3, [2, 2, 1]),
+    (1, 2, 4, [2, 2]),
+    # Buckets never extend past the end of the dataset
+    (10, 2, 7, [2]),
+    (10**12, None, 7, [2]),
+]
+
+
+@pytest.mark.parametrize("bucketSize,maxBuckets,expectedSize,expected", test_bucket_tuple)
+def test_occupancy_timeline_buckets(
+    bucketSize: int, maxBuckets: int, expectedSize: int, expected: List[int]
+):
+    tracks = [
+        track(0, [feature(3), feature(4, True), feature(7)], [["fish", 1]]),
+        track(1, [feature(5, True), feature(8)], [["fish", 1]]),
+        track(2, [feature(9)], [["fish", 1]]),
+    ]
+    timeline = stats.occupancy_timeline(
+        {str(t["trackId"]): t for t in tracks}, bucketSize=bucketSize, maxBuckets=maxBuckets
+    )
+    assert (timeline.begin, timeline.end) == (3, 9)
+    assert timeline.bucket_size == expectedSize
+    assert timeline.types[0].counts == expected
@@ -0,0 +1,99 @@
+import io
+import os
+from pathlib import Path
+import time
+from typing import List
+
+import pytest
+
+from dive_utils.export_cache import ExportCache, read_range, resolve_range
+
+test_tuple = [
+    (["a,b\n", "c,d\n"], b"a,b\nc,d\n"),
+    ([b"PK", b"\x00\x01", b""], b"PK\x00\x01"),
+    ([], b""),
+]
+
+
+@pytest.mark.parametrize("chunks,expected", test_tuple)
+def test_write_through(tmp_path: Path, chunks: List, expected: bytes):
+    cache = ExportCache(tmp_path, 1024)
+    key = ExportCache.make_key('csv', chunks)
+    assert cache.open(key) is None
+    assert b"".join(cache.write_through(key, iter(chunks))) == expected
+    with cache.open(key) as fp:
+        assert fp.read() == expected
+
+
+def test_write_through_abandoned(tmp_path: Path):
+    cache = ExportCache(tmp_path, 1024)
+    stream = cache.write_through('key', iter([b"first", b"second"]))
+    assert next(stream) == b"first"
+    stream.close()
+    assert cache.open('key') is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_write_through_oversize(tmp_path: Path):
+    cache = ExportCache(tmp_path, 8)
+    assert b"".join(cache.write_through('key', iter([b"12345", b"67890"]))) == b"1234567890"
+    assert cache.open('key') is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_evict_least_recently_used(tmp_path: Path):
+    cache = ExportCache(tmp_path, 10)
+    for key in ['a', 'b', 'c']:
+        list(cache.write_through(key, iter([b"1234"])))
+        if key == 'b':
+            # b is evicted when c overflows the cache, unless a was used more recently
+            past = time.time() - 60
+            os.utime(tmp_path / 'a', (past, past))
+            os.utime(tmp_path / 'b', (past + 1, past + 1))
+            cache.open('a').close()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['a', 'c']
+
+
+@pytest.mark.parametrize(
+    "offset,endByte,expected",
+    [(0, 10, b"0123456789"), (2, 5, b"234"), (9, 10, b"9"), (4, 4, b"")],
+)
+def test_read_range(offset: int, endByte: int, expected: bytes):
+    assert b"".join(read_range(io.BytesIO(b"0123456789"), offset, endByte)) == expected
+
+
+range_tuple = [
+    # No Range, or a Range this server does not understand, sends the whole entry
+    (None, None, (200, 0, 100)),
+    ("items=0-10", None, (200, 0, 100)),
+    ("bytes=10-5", None, (200, 0, 100)),
+    ("bytes=abc", None, (200, 0, 100)),
+    # Satisfiable ranges are clamped to the entry
+    ("bytes=0-9", None, (206, 0, 10)),
+    ("bytes=90-", None, (206, 90, 100)),
+    ("bytes=90-200", None, (206, 90, 100)),
+    ("bytes=-30", None, (206, 70, 100)),
+    ("bytes=-300", None, (206, 0, 100)),
+    ("bytes=100-, 5-9", None, (206, 5, 10)),
+    # Nothing can be served from past the end
+    ("bytes=100-", None, (416, 0, 0)),
+    ("bytes=-0", None, (416, 0, 0)),
+    # A resume only continues the same export
+    ("bytes=50-", '"etag"', (206, 50, 100)),
+    ("bytes=50-", '"other"', (200, 0, 100)),
+    ("bytes=50-", 'Wed, 21 Oct 2015 07:28:00 GMT', (200, 0, 100)),
+]
+
+
+@pytest.mark.parametrize("rangeHeader,ifRange,expected", range_tuple)
+def test_resolve_range(rangeHeader, ifRange, expected):
+    assert resolve_range(100, rangeHeader, ifRange, '"etag"') == expected
+    status, offset, endByte = expected
+    if status == 206:
+        data = bytes(range(100))
+        assert b"".join(read_range(io.BytesIO(data), offset, endByte)) == data[offset:endByte]
+
+
+def test_resolve_range_empty():
+    assert resolve_range(0, None, None, '"etag"') == (200, 0, 0)
+    assert resolve_range(0, "bytes=0-", None, '"etag"') == (416, 0, 0)
@@ -0,0 +1,100 @@
+import hashlib
+import os
+from pathlib import Path
+import time
+from typing import List, Optional
+
+import pytest
+
+from dive_utils.media_cache import IncompleteDownload, MediaCache
+
+
+class Downloader:
+    def __init__(self, content: bytes):
+        self.content = content
+        self.calls: List[Path] = []
+
+    def __call__(self, path: Path):
+        self.calls.append(path)
+        path.write_bytes(self.content)
+
+
+def sha512(content: bytes) -> str:
+    return hashlib.sha512(content).hexdigest()
+
+
+def test_fetch_links_cached_entry(tmp_path: Path):
+    cache = MediaCache(tmp_path / 'cache', 1024)
+    download = Downloader(b"video")
+    key = MediaCache.make_key('file', sha512(b"video"))
+    for job in ['one', 'two']:
+        dest = tmp_path / job
+        dest.mkdir()
+        cache.fetch('file', sha512(b"video"), 5, dest / 'video.mp4', download)
+        assert (dest / 'video.mp4').read_bytes() == b"video"
+    assert len(download.calls) == 1
+    assert os.path.samefile(tmp_path / 'one' / 'video.mp4', tmp_path / 'cache' / key)
+    assert not list((tmp_path / 'cache').glob('*.partial'))
+
+
+@pytest.mark.parametrize(
+    "max_size,checksum,size",
+    [(0, sha512(b"image"), 5), (1024, None, 5), (4, sha512(b"image"), 5)],
+)
+def test_fetch_uncached(tmp_path: Path, max_size: int, checksum: Optional[str], size: int):
+    cache = MediaCache(tmp_path / 'cache', max_size)
+    download = Downloader(b"image")
+    for _ in range(2):
+        cache.fetch('file', checksum, size, tmp_path / 'image.png', download)
+    assert download.calls == [tmp_path / 'image.png', tmp_path / 'image.png']
+    assert (tmp_path / 'image.png').read_bytes() == b"image"
+    assert not (tmp_path / 'cache').exists() or not [
+        path for path in (tmp_path / 'cache').iterdir() if path.name != '.lock'
+    ]
+
+
+def test_fetch_failed_download(tmp_path: Path):
+    cache = MediaCache(tmp_path / 'cache', 1024)
+
+    def download(path: Path):
+        path.write_bytes(b"partial")
+        raise ConnectionError()
+
+    with pytest.raises(ConnectionError):
+        cache.fetch('file', sha512(b"image"), 5, tmp_path / 'image.png', download)
+    assert [path.name for path in (tmp_path / 'cache').iterdir()] == ['.lock']
+    assert not (tmp_path / 'image.png').exists()
+
+
+def test_evict_least_recently_used(tmp_path: Path):
+    cache = MediaCache(tmp_path / 'cache', 12)
+    jobs = tmp_path / 'jobs'
+    jobs.mkdir()
+    past = time.time() - 60
+    checksum = sha512(b"1234")
+    for index, fileId in enumerate(['a', 'b', 'c']):
+        cache.fetch(fileId, checksum, 4, jobs / fileId, Downloader(b"1234"))
+        key = MediaCache.make_key(fileId, checksum)
+        os.utime(tmp_path / 'cache' / key, (past + index, past + index))
+    # a is still linked into a job, and b is used again, so c is evicted when d overflows
+    (jobs / 'b').unlink()
+    (jobs / 'c').unlink()
+    cache.fetch('b', checksum, 4, jobs / 'b', Downloader(b"1234"))
+    (jobs / 'b').unlink()
+    cache.fetch('d', checksum, 4, jobs / 'd', Downloader(b"1234"))
+    names = sorted(path.name for path in (tmp_path / 'cache').iterdir() if path.name != '.lock')
+    assert names == [MediaCache.make_key(fileId, checksum) for fileId in ['a', 'b', 'd']]
+
+
+@pytest.mark.parametrize("content", [b"ima", b"imagery", b"imago"])
+def test_fetch_mismatched_download(tmp_path: Path, content: bytes):
+    cache = MediaCache(tmp_path / 'cache', 1024)
+    checksum = sha512(b"image")
+    with pytest.raises(IncompleteDownload):
+        cache.fetch('file', checksum, 5, tmp_path / 'image.png', Downloader(content))
+    assert [path.name for path in (tmp_path / 'cache').iterdir()] == ['.lock']
+    assert not (tmp_path / 'image.png').exists()
+    download = Downloader(b"image")
+    cache.fetch('file', checksum, 5, tmp_path / 'image.png', download)
+    assert len(download.calls) == 1
+    assert (tmp_path / 'image.png').read_bytes() == b"image"
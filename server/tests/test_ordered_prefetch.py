@@ -0,0 +1,64 @@
+import random
+import threading
+import time
+from typing import List
+
+import pytest
+
+from dive_utils import ordered_prefetch
+
+test_tuple = [
+    ([], 4),
+    ([1], 4),
+    (list(range(50)), 1),
+    (list(range(50)), 8),
+    (list(range(7)), 16),
+]
+
+
+@pytest.mark.parametrize("input,concurrency", test_tuple)
+def test_ordered_prefetch(input: List[int], concurrency: int):
+    def slow_square(value: int) -> int:
+        time.sleep(random.random() / 1000)
+        return value * value
+
+    assert list(ordered_prefetch(slow_square, input, concurrency)) == [v * v for v in input]
+
+
+@pytest.mark.parametrize("concurrency", [2, 4])
+def test_ordered_prefetch_bounded(concurrency: int):
+    lock = threading.Lock()
+    started: List[int] = []
+
+    def record(value: int) -> int:
+        with lock:
+            started.append(value)
+        return value
+
+    results = ordered_prefetch(record, range(100), concurrency)
+    assert next(results) == 0
+    # Nothing beyond the read-ahead window may have been submitted
+    assert len(started) <= concurrency
+    results.close()
+
+
+def test_ordered_prefetch_close_waits():
+    started = threading.Event()
+    finished: List[int] = []
+
+    def slow(value: int) -> int:
+        if value == 1:
+            started.set()
+            time.sleep(0.05)
+        finished.append(value)
+        return value
+
+    results = ordered_prefetch(slow, range(100), 4)
+    assert next(results) == 0
+    started.wait()
+    results.close()
+    # The running call completed before close returned, and queued calls never ran
+    assert 1 in finished
+    count = len(finished)
+    time.sleep(0.1)
+    assert len(finished) == count
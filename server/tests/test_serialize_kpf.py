@@ -0,0 +1,137 @@
+import json
+from typing import Dict, List, Tuple
+
+from boiler.serialization import kpf
+import pytest
+
+from dive_utils.serializers import meva
+
+test_tuple: List[Tuple[dict, Dict[str, List[str]]]] = [
+    (
+        {
+            "1": {
+                "trackId": 1,
+                "attributes": {
+                    "activity_id": 5,
+                    "activity": "person_walks",
+                    "confidence": 0.8,
+                    "status": "scored",
+                },
+                "confidencePairs": [["vehicle", 0.2], ["person", 0.9]],
+                "features": [
+                    {
+                        "frame": 0,
+                        "bounds": [0, 0, 10, 10],
+                        "keyframe": True,
+                        "interpolate": True,
+                    },
+                    {
+                        "frame": 2,
+                        "bounds": [2, 2, 12, 12],
+                        "keyframe": True,
+                        "interpolate": False,
+                    },
+                ],
+                "begin": 0,
+                "end": 2,
+            },
+            "2": {
+                "trackId": 2,
+                "attributes": {},
+                "confidencePairs": [["vehicle", 1.0]],
+                "features": [
+                    {
+                        "frame": 1,
+                        "bounds": [5, 5, 6, 6],
+                        "keyframe": True,
+                        "interpolate": False,
+                    }
+                ],
+                "begin": 1,
+                "end": 1,
+            },
+        },
+        {
+            "geom": [
+                '{"geom": {"id1": 1, "id0": 1, "ts0": 0, "g0": "0 0 10 10", "keyframe": true, "ts1": 0.0}}',
+                '{"geom": {"id1": 1, "id0": 2, "ts0": 1, "g0": "1 1 11 11", "keyframe": false, "ts1": 0.1}}',
+                '{"geom": {"id1": 1, "id0": 3, "ts0": 2, "g0": "2 2 12 12", "keyframe": true, "ts1": 0.2}}',
+                '{"geom": {"id1": 2, "id0": 4, "ts0": 1, "g0": "5 5 6 6", "keyframe": true, "ts1": 0.1}}',
+            ],
+            "types": [
+                '{"types": {"id1": 1, "cset3": {"person": 0.9}}}',
+                '{"types": {"id1": 2, "cset3": {"vehicle": 1.0}}}',
+            ],
+            "activities": [
+                '{"act": {"act2": {"person_walks": 0.8}, "id2": 5, "timespan": [{"tsr0": [0, 2]}], "actors": [{"id1": 1, "timespan": [{"tsr0": [0, 2]}]}], "src_status": "scored"}}',
+            ],
+        },
+    ),
+]
+
+
+@pytest.mark.parametrize("input,expected", test_tuple)
+def test_write_kpf(input: Dict[str, dict], expected: Dict[str, List[str]]):
+    documents = meva.export_tracks_as_kpf(input, fps=10)
+    assert list(documents.keys()) == list(expected.keys())
+    for suffix, lines in documents.items():
+        for i, line in enumerate(lines):
+            assert line.startswith('- ')
+            assert json.loads(line[2:]) == json.loads(expected[suffix][i])
+
+
+round_trip_tuple = [
+    {
+        "1": {
+            "trackId": 1,
+            "attributes": {},
+            "confidencePairs": [["person", 0.9]],
+            "features": [
+                {"frame": 3, "bounds": [10, 20, 30, 45]},
+                {"frame": 5, "bounds": [12, 22, 40, 60]},
+            ],
+            "begin": 3,
+            "end": 5,
+        },
+        "2": {
+            "trackId": 2,
+            "attributes": {},
+            "confidencePairs": [["vehicle", 0.5]],
+            "features": [{"frame": 4, "bounds": [1, 2, 3, 7]}],
+            "begin": 4,
+            "end": 4,
+        },
+    },
+]
+
+
+@pytest.mark.parametrize("input", round_trip_tuple)
+def test_kpf_round_trip(input: Dict[str, dict]):
+    fps = 29.97
+    documents = meva.export_tracks_as_kpf(input, fps=fps)
+    readers = [[line.encode() for line in lines] for lines in documents.values()]
+    output = meva.load_kpf_as_tracks(readers)
+    assert 'error' not in output
+    assert len(output) == len(input)
+    for expected, track in zip(input.values(), output.values()):
+        assert (track['begin'], track['end']) == (expected['begin'], expected['end'])
+        assert [list(pair) for pair in track['confidencePairs']] == expected['confidencePairs']
+        assert [f['frame'] for f in track['features']] == [f['frame'] for f in expected['features']]
+        assert [f['bounds'] for f in track['features']] == [
+            f['bounds'] for f in expected['features']
+        ]
+        assert [f['attributes']['timestamp'] for f in track['features']] == pytest.approx(
+            [f['frame'] / fps for f in expected['features']]
+        )
+
+
+def test_write_kpf_empty():
+    for lines in meva.export_tracks_as_kpf({}).values():
+        assert kpf.load_yaml(''.join(lines)) == []
+
+
+def test_read_kpf_without_types():
+    geom = meva.export_tracks_as_kpf(round_trip_tuple[0])['geom']
+    output = meva.load_kpf_as_tracks([[line.encode() for line in geom]])
+    for track in output.values():
+        assert [list(pair) for pair in track['confidencePairs']] == [["other", 1.0]]
@@ -296,10 +296,52 @@ test_tuple: List[Tuple[dict, list, list]] = [
 
 
 @pytest.mark.parametrize("input,expected,typeFilter", test_tuple)
-def test_write_viame_csv(input: Dict[str, dict], expected: List[str], typeFilter: List[str]):
+@pytest.mark.parametrize("trusted", [False, True])
+def test_write_viame_csv(
+    input: Dict[str, dict], expected: List[str], typeFilter: List[str], trusted: bool
+):
     for i, line in enumerate(
         viame.export_tracks_as_csv(
-            input, filenames=filenames, header=False, typeFilter=set(typeFilter)
+            input, filenames=filenames, header=False, typeFilter=set(typeFilter), trusted=trusted
         )
     ):
         assert line.strip(' ').rstrip() == expected[i]
+
+
+merge_tuple: List[Tuple[List[Tuple[int, List[str]]], List[str]]] = [
+    ([], []),
+    (
+        [
+            (
+                0,
+                [
+                    "# 1: Detection or Track-id,2: Video or Image Identifier",
+                    "0,a.png,0,1,2,3,4,0.9,0,fish,0.9",
+                    "3,b.png,1,1,2,3,4,0.8,0,fish,0.8",
+                ],
+            ),
+            (
+                2,
+                [
+                    "# 1: Detection or Track-id,2: Video or Image Identifier",
+                    "0,c.png,0,1,2,3,4,0.7,0,rock,0.7",
+                ],
+            ),
+            (3, []),
+            (3, ["1,d.png,0,1,2,3,4,0.6,0,fish,0.6", "0,e.png,1,1,2,3,4,0.5,0,fish,0.5"]),
+        ],
+        [
+            "# 1: Detection or Track-id,2: Video or Image Identifier",
+            "0,a.png,0,1,2,3,4,0.9,0,fish,0.9",
+            "3,b.png,1,1,2,3,4,0.8,0,fish,0.8",
+            "4,c.png,2,1,2,3,4,0.7,0,rock,0.7",
+            "6,d.png,3,1,2,3,4,0.6,0,fish,0.6",
+            "5,e.png,4,1,2,3,4,0.5,0,fish,0.5",
+        ],
+    ),
+]
+
+
+@pytest.mark.parametrize("chunks,expected", merge_tuple)
+def test_merge_csv_chunks(chunks: List[Tuple[int, List[str]]], expected: List[str]):
+    assert "".join(viame.merge_csv_chunks(chunks)).splitlines() == expected
@@ -0,0 +1,96 @@
+import io
+from pathlib import Path
+import tarfile
+from typing import List, Tuple
+
+import pytest
+
+from dive_utils.tarstream import (
+    IncompleteArchive,
+    extract_expected,
+    extract_flat,
+    tar_file,
+    tar_footer,
+)
+
+test_tuple: List[List[Tuple[str, List[bytes]]]] = [
+    [],
+    [("0001.png", [b"\x89PNG", b"data"])],
+    [
+        ("frame_10.jpg", [b"x" * 512]),
+        ("frame_2.jpg", [b"", b"y" * 513]),
+        ("a" * 150 + ".jpg", [b"long name"]),
+    ],
+]
+
+
+def archive(files: List[Tuple[str, List[bytes]]]) -> bytes:
+    stream = []
+    for name, chunks in files:
+        stream.extend(tar_file(name, sum(len(c) for c in chunks), iter(chunks), mtime=100))
+    stream.append(tar_footer())
+    return b"".join(stream)
+
+
+@pytest.mark.parametrize("files", test_tuple)
+def test_tar_file(files: List[Tuple[str, List[bytes]]]):
+    with tarfile.open(fileobj=io.BytesIO(archive(files)), mode='r:') as tar:
+        members = tar.getmembers()
+        assert [m.name for m in members] == [name for name, _ in files]
+        for member, (_, chunks) in zip(members, files):
+            assert tar.extractfile(member).read() == b"".join(chunks)
+            assert member.mtime == 100
+
+
+def test_tar_file_size_mismatch():
+    with pytest.raises(ValueError):
+        list(tar_file("image.png", 10, iter([b"short"])))
+
+
+@pytest.mark.parametrize("files", test_tuple)
+def test_extract_flat(tmp_path: Path, files: List[Tuple[str, List[bytes]]]):
+    paths = list(extract_flat(io.BytesIO(archive(files)), tmp_path))
+    assert paths == [tmp_path / name for name, _ in files]
+    for path, (_, chunks) in zip(paths, files):
+        assert path.read_bytes() == b"".join(chunks)
+
+
+def test_extract_flat_discards_directories(tmp_path: Path):
+    data = archive([("../escape.png", [b"1"]), ("nested/dir/image.png", [b"2"])])
+    dest = tmp_path / 'dest'
+    dest.mkdir()
+    assert list(extract_flat(io.BytesIO(data), dest)) == [dest / 'escape.png', dest / 'image.png']
+    assert not (tmp_path / 'escape.png').exists()
+
+
+@pytest.mark.parametrize("files", test_tuple)
+def test_extract_expected(tmp_path: Path, files: List[Tuple[str, List[bytes]]]):
+    names = [name for name, _ in files]
+    paths = list(extract_expected(io.BytesIO(archive(files)), tmp_path, names))
+    assert paths == [tmp_path / name for name in names]
+
+
+# Cut points in an archive of two 3 byte members, each a 512 byte header and a padded block
+cut_tuple = [
+    # Between the members, and inside the second header, tarfile sees a complete archive
+    1024,
+    1124,
+    # Inside the second member's data
+    1538,
+]
+
+
+@pytest.mark.parametrize("cut", cut_tuple)
+def test_extract_expected_cut_off(tmp_path: Path, cut: int):
+    data = archive([("a.png", [b"abc"]), ("b.png", [b"def"])])
+    with pytest.raises(tarfile.TarError):
+        list(extract_expected(io.BytesIO(data[:cut]), tmp_path, ["a.png", "b.png"]))
+
+
+@pytest.mark.parametrize(
+    "names", [["a.png"], ["a.png", "c.png"], ["b.png", "a.png"], ["a.png", "b.png", "c.png"]]
+)
+def test_extract_expected_mismatch(tmp_path: Path, names: List[str]):
+    data = archive([("a.png", [b"abc"]), ("b.png", [b"def"])])
+    with pytest.raises(IncompleteArchive):
+        list(extract_expected(io.BytesIO(data), tmp_path, names))
@@ -0,0 +1,36 @@
+from typing import Dict, List
+
+import pytest
+
+from dive_utils import models, thresholds
+
+track_dict = {
+    "0": {"trackId": 0, "begin": 0, "end": 0, "confidencePairs": [["fish", 0.9], ["rock", 0.1]]},
+    "1": {"trackId": 1, "begin": 0, "end": 0, "confidencePairs": [["fish", 0.3]]},
+    "2": {"trackId": 2, "begin": 0, "end": 0, "confidencePairs": [["rock", 0.5]]},
+    "3": {"trackId": 3, "begin": 0, "end": 0, "confidencePairs": []},
+    "4": {"trackId": 4, "begin": 0, "end": 0, "confidencePairs": [["crab", 0.2], ["fish", 0.2]]},
+}
+
+test_tuple = [
+    ({}, [True, True, True, False, True]),
+    ({"default": 0.5}, [True, False, True, False, False]),
+    ({"default": 0.5, "fish": 0.25}, [True, True, True, False, False]),
+    ({"default": 0.1, "rock": 0.6, "crab": 0.2}, [True, True, False, False, True]),
+    ({"fish": 1.0}, [True, False, True, False, True]),
+]
+
+
+@pytest.mark.parametrize("filters,expected", test_tuple)
+def test_exceeds_thresholds(filters: Dict[str, float], expected: List[bool]):
+    arrays = thresholds.load_confidence_arrays(track_dict.values())
+    mask = thresholds.exceeds_thresholds(arrays, filters)
+    assert mask.tolist() == expected
+    assert mask.tolist() == [
+        models.Track(**t).exceeds_thresholds(filters) for t in track_dict.values()
+    ]
+
+
+def test_exceeds_thresholds_empty():
+    arrays = thresholds.load_confidence_arrays([])
+    assert thresholds.exceeds_thresholds(arrays, {"default": 0.1}).tolist() == []
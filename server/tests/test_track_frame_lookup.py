@@ -0,0 +1,65 @@
+from typing import List, Optional
+
+import pytest
+
+from dive_utils import models
+
+track_json = {
+    "trackId": 0,
+    "attributes": {},
+    "confidencePairs": [["foo", 0.5]],
+    "features": [
+        {"frame": 1, "bounds": [2, 2, 4, 4], "interpolate": True, "keyframe": True},
+        {"frame": 3, "bounds": [4, 4, 8, 8], "interpolate": False, "keyframe": True},
+        {"frame": 6, "bounds": [0, 0, 1, 1], "interpolate": True, "keyframe": True},
+        {"frame": 10, "bounds": [4, 4, 5, 5], "interpolate": True, "keyframe": True},
+    ],
+    "begin": 1,
+    "end": 10,
+}
+
+test_tuple = [
+    # before the track begins
+    (0, None),
+    # exact keyframes
+    (1, [2, 2, 4, 4]),
+    (3, [4, 4, 8, 8]),
+    (10, [4, 4, 5, 5]),
+    # interpolated spans
+    (2, [3, 3, 6, 6]),
+    (8, [2, 2, 3, 3]),
+    # gap after a keyframe with interpolation disabled
+    (4, None),
+    (5, None),
+    # after the track ends, even though the last keyframe interpolates
+    (11, None),
+]
+
+
+@pytest.mark.parametrize("frame,expected", test_tuple)
+@pytest.mark.parametrize("constructor", [lambda t: models.Track(**t), models.TrackRecord.from_dict])
+def test_feature_at(frame: int, expected: Optional[List[int]], constructor):
+    feature = constructor(track_json).feature_at(frame)
+    if expected is None:
+        assert feature is None
+    else:
+        assert feature.frame == frame
+        assert feature.bounds == expected
+
+
+def test_feature_at_matches_interpolate():
+    track = models.TrackRecord.from_dict(track_json)
+    expanded = models.interpolate(track.features[2], track.features[3])
+    for feature in expanded:
+        assert track.feature_at(feature.frame).bounds == feature.bounds
+
+
+def test_features_at_frame():
+    tracks = [
+        models.TrackRecord.from_dict(track_json),
+        models.TrackRecord.from_dict({**track_json, "trackId": 1, "features": [], "begin": 0}),
+    ]
+    found = models.features_at_frame(tracks, 2)
+    assert list(found.keys()) == [0]
+    assert found[0].bounds == [3, 3, 6, 6]
+    assert found[0].keyframe is False
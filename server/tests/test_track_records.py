@@ -0,0 +1,138 @@
+import copy
+from typing import Any, Dict
+
+from pydantic import ValidationError
+import pytest
+
+from dive_utils import models
+
+geometry = {
+    "type": "FeatureCollection",
+    "features": [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [1.0, 2.0]},
+            "properties": {"key": "head"},
+        }
+    ],
+}
+
+track_json: Dict[str, Any] = {
+    "trackId": 3,
+    "begin": 1,
+    "end": 4,
+    "confidencePairs": [["fish", 0.75], ["rock", 0.25]],
+    "attributes": {"color": "red", "count": 2.0},
+    "features": [
+        {
+            "frame": 1,
+            "flick": 1001,
+            "bounds": [0, 0, 10, 10],
+            "attributes": {"occluded": True},
+            "geometry": geometry,
+            "head": [1.0, 2.0],
+            "tail": [9.0, 8.0],
+            "fishLength": 12.5,
+            "interpolate": True,
+            "keyframe": True,
+        },
+        {"frame": 4, "bounds": [4, 4, 16, 16], "interpolate": False, "keyframe": True},
+    ],
+}
+
+
+def with_changes(change) -> Dict[str, Any]:
+    track = copy.deepcopy(track_json)
+    change(track)
+    return track
+
+
+def test_round_trip():
+    track = models.TrackRecord.from_dict(track_json)
+    assert track.to_dict() == track_json
+    feature = models.FeatureRecord.from_dict(track_json["features"][0])
+    assert feature.to_dict() == track_json["features"][0]
+
+
+def test_round_trip_defaults():
+    feature = models.FeatureRecord.from_dict({"frame": 2, "bounds": [1, 2, 3, 4]})
+    assert feature.to_dict() == {
+        "frame": 2,
+        "bounds": [1, 2, 3, 4],
+        "interpolate": False,
+        "keyframe": True,
+    }
+    track = models.TrackRecord.from_dict({"trackId": 0, "begin": 0, "end": 0})
+    assert track.to_dict() == {
+        "trackId": 0,
+        "begin": 0,
+        "end": 0,
+        "features": [],
+        "confidencePairs": [],
+        "attributes": {},
+    }
+
+
+@pytest.mark.parametrize("trusted", [True, False])
+def test_load_track_records(trusted: bool):
+    records = list(models.load_track_records({"3": track_json}, trusted=trusted))
+    assert len(records) == 1
+    assert all(isinstance(f, models.FeatureRecord) for f in records[0].features)
+    loaded = records[0].to_dict()
+    # Validation through Track normalizes pairs to tuples
+    loaded["confidencePairs"] = [list(pair) for pair in loaded["confidencePairs"]]
+    for feature in loaded["features"]:
+        for key in ["head", "tail"]:
+            if key in feature:
+                feature[key] = list(feature[key])
+    assert loaded == track_json
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda t: t["features"][1].update(frame="abc"),
+        lambda t: t["features"][1].update(bounds=[4, 4, "abc", 16]),
+        lambda t: t["features"][1].pop("bounds"),
+        lambda t: t.update(begin=0),
+        lambda t: t.update(trackId="abc"),
+    ],
+)
+def test_load_untrusted_rejects_malformed(change):
+    malformed = with_changes(change)
+    with pytest.raises(ValidationError):
+        models.Track(**malformed)
+    with pytest.raises(ValidationError):
+        list(models.load_track_records({"3": malformed}, trusted=False))
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        # Track does not check the number of bounds, so neither do records
+        lambda t: t["features"][1].update(bounds=[4, 4, 16]),
+        lambda t: t["features"][1].update(frame="4"),
+    ],
+)
+def test_load_untrusted_accepts_what_track_accepts(change):
+    loose = with_changes(change)
+    expected = models.Track(**loose).dict(exclude_none=True)
+    records = list(models.load_track_records({"3": loose}, trusted=False))
+    assert records[0].to_dict() == expected
+
+
+@pytest.mark.parametrize(
+    "constructor,featureType",
+    [
+        (models.TrackRecord.from_dict, models.FeatureRecord),
+        (lambda t: models.Track(**t), models.Feature),
+    ],
+)
+def test_interpolate_keeps_type(constructor, featureType):
+    track = constructor(track_json)
+    expanded = models.interpolate(track.features[0], track.features[1])
+    assert [f.frame for f in expanded] == [1, 2, 3]
+    assert all(type(f) is featureType for f in expanded)
+    assert expanded[0] is track.features[0]
+    assert [f.bounds for f in expanded[1:]] == [[1, 1, 12, 12], [3, 3, 14, 14]]
+    assert all(f.keyframe is False for f in expanded[1:])